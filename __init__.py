@@ -1,4 +1,37 @@
-"""A simfile parsing library, intended for SM files."""
-from . import simfile_parser
+"""A simfile parsing library, intended for SM files.
 
-parse_simfile = simfile_parser.parse
+Submodules and the entry points below are imported on first access,
+so using e.g. `basic_types` alone doesn't pay for importing the parser."""
+from importlib import import_module
+
+_SUBMODULES = frozenset({
+    'assets', 'async_parser', 'basic_types', 'chart_analysis', 'complex_types', 'diff', 'events', 'features',
+    'incremental_parser', 'judging', 'patterns', 'radar', 'rows', 'scroll', 'simfile_parser', 'sketches', 'timing',
+    'validation',
+})
+
+_ENTRY_POINTS = {
+    'parse_simfile': ('simfile_parser', 'parse'),
+    'parse_simfile_async': ('async_parser', 'parse_async'),
+    'parse_simfiles_async': ('async_parser', 'parse_many_async'),
+    'IncrementalParser': ('incremental_parser', 'IncrementalParser'),
+}
+
+__all__ = sorted(_ENTRY_POINTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return import_module('.' + name, __name__)
+
+    try:
+        module_name, attribute = _ENTRY_POINTS[name]
+    except KeyError:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name)) from None
+
+    value = globals()[name] = getattr(import_module('.' + module_name, __name__), attribute)
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_SUBMODULES, *_ENTRY_POINTS})
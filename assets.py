@@ -0,0 +1,247 @@
+"""Pooled, read-only access to the files a simfile refers to, such as music and banners."""
+import mmap
+from collections import OrderedDict
+from contextlib import contextmanager
+from os import listdir, path, stat
+from threading import Lock
+from typing import Dict, Iterable, Iterator, Optional, Set, Union
+
+AssetBuffer = Union[mmap.mmap, bytes]
+
+
+class AssetPool(object):
+    """Memory-mapped buffers of files by their absolute path, with at most `max_open` mapped at once.
+
+    When the pool is full, the least recently used buffer that isn't leased (see `lease`)
+    and that has no view left on it is closed. If every buffer is in use, the pool grows past `max_open`
+    until some are given back. Every `AssetManager` shares the process-wide pool given by `shared_pool`
+    unless it's given one, so the limit applies to all simfiles."""
+
+    def __init__(self, max_open: int = 16):
+        if max_open < 1:
+            raise ValueError('max_open must be at least 1')
+
+        self.max_open = max_open
+        self._buffers: 'OrderedDict[str, AssetBuffer]' = OrderedDict()
+        # Amount of managers that use each path, and of leases held on it
+        self._owners: Dict[str, int] = {}
+        self._leases: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def buffer(self, resolved: str) -> AssetBuffer:
+        """A pooled buffer of the file at the absolute path `resolved`, mapped if it isn't already."""
+        with self._lock:
+            return self._buffer(resolved)
+
+    def _buffer(self, resolved: str) -> AssetBuffer:
+        try:
+            self._buffers.move_to_end(resolved)
+            return self._buffers[resolved]
+        except KeyError:
+            pass
+
+        self._evict(len(self._buffers) + 1 - self.max_open)
+        result = self._buffers[resolved] = _map(resolved)
+        return result
+
+    def _evict(self, amount: int):
+        for resolved in list(self._buffers):
+            if amount <= 0:
+                break
+            if not self._leases.get(resolved) and self._try_close(resolved):
+                amount -= 1
+
+    def _try_close(self, resolved: str) -> bool:
+        try:
+            _close_buffer(self._buffers[resolved])
+        except BufferError:
+            # Someone still holds a view of it, it stays pooled until they let go
+            return False
+        del self._buffers[resolved]
+        return True
+
+    @contextmanager
+    def lease(self, resolved: str) -> Iterator[AssetBuffer]:
+        """A pooled buffer that isn't evicted until the block exits."""
+        with self._lock:
+            result = self._buffer(resolved)
+            self._leases[resolved] = self._leases.get(resolved, 0) + 1
+        try:
+            yield result
+        finally:
+            with self._lock:
+                self._leases[resolved] -= 1
+                if not self._leases[resolved]:
+                    del self._leases[resolved]
+
+    def acquire(self, resolved: str):
+        """Count one more user of a path, its buffer is kept by `release` until every user released it."""
+        with self._lock:
+            self._owners[resolved] = self._owners.get(resolved, 0) + 1
+
+    def release(self, resolved_paths: Iterable[str]):
+        """Count one user less of these paths, and close the buffers that are left without users."""
+        with self._lock:
+            for resolved in resolved_paths:
+                owners = self._owners.get(resolved, 0) - 1
+                if owners > 0:
+                    self._owners[resolved] = owners
+                    continue
+
+                self._owners.pop(resolved, None)
+                if resolved in self._buffers and not self._leases.get(resolved):
+                    self._try_close(resolved)
+
+    def close(self):
+        """Close every pooled buffer that isn't in use."""
+        with self._lock:
+            for resolved in list(self._buffers):
+                if not self._leases.get(resolved):
+                    self._try_close(resolved)
+
+    def __getstate__(self):
+        # Mapped buffers can't be pickled, the receiving side maps its own
+        return {'max_open': self.max_open}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_open'])
+
+
+_SHARED_POOL = AssetPool()
+
+
+def shared_pool() -> AssetPool:
+    """The pool used by asset managers that aren't given one."""
+    return _SHARED_POOL
+
+
+def set_shared_pool(pool: AssetPool) -> AssetPool:
+    """Replace the pool used by asset managers that aren't given one, such as to change `max_open`.
+
+    The previous pool is returned, close it if its buffers aren't used anymore."""
+    global _SHARED_POOL
+    previous, _SHARED_POOL = _SHARED_POOL, pool
+    return previous
+
+
+def _map(resolved: str) -> AssetBuffer:
+    with open(resolved, 'rb') as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return b''
+
+
+def _close_buffer(buffer: Optional[AssetBuffer]):
+    if isinstance(buffer, mmap.mmap):
+        buffer.close()
+
+
+class AssetManager(object):
+    """Resolves asset paths relative to a simfile's directory and hands out read-only buffers to them.
+
+    Paths are resolved once, falling back to a case-insensitive match
+    as packs are often authored on case-insensitive file systems.
+    Buffers handed out by `buffer` come from `pool`, the shared pool by default,
+    and can be closed when they're evicted from it, so use `lease` or `open` for buffers used across other accesses.
+    Buffers are read-only bytes-like objects, not file objects: an `mmap`, or `b''` for empty files."""
+
+    def __init__(self, file_context: Optional[str] = None, pool: Optional[AssetPool] = None):
+        self.file_context = file_context or ''
+        self._own_pool = pool
+        self._resolved: Dict[str, Optional[str]] = {}
+        # Paths this manager counts as a user of in the pool
+        self._acquired: Set[str] = set()
+
+    @property
+    def pool(self) -> AssetPool:
+        return shared_pool() if self._own_pool is None else self._own_pool
+
+    def resolve(self, asset_path: str) -> Optional[str]:
+        """The absolute path of an asset, or None if it doesn't exist."""
+        try:
+            return self._resolved[asset_path]
+        except KeyError:
+            pass
+
+        full_path = path.abspath(path.join(self.file_context, asset_path))
+        if not path.isfile(full_path):
+            full_path = self._resolve_case_insensitive(full_path)
+
+        self._resolved[asset_path] = full_path
+        return full_path
+
+    @staticmethod
+    def _resolve_case_insensitive(full_path: str) -> Optional[str]:
+        directory, name = path.split(full_path)
+        try:
+            candidates = listdir(directory)
+        except OSError:
+            return None
+
+        name = name.lower()
+        for candidate in candidates:
+            candidate_path = path.join(directory, candidate)
+            if candidate.lower() == name and path.isfile(candidate_path):
+                return candidate_path
+        return None
+
+    def size(self, asset_path: str) -> Optional[int]:
+        """The size of an asset in bytes, or None if it doesn't exist. The file isn't opened."""
+        resolved = self.resolve(asset_path)
+        return resolved and stat(resolved).st_size
+
+    def buffer(self, asset_path: str) -> Optional[AssetBuffer]:
+        """A pooled read-only buffer of an asset, or None if it doesn't exist.
+
+        The buffer stays valid until it's evicted from the pool or the manager is closed."""
+        resolved = self._acquire(asset_path)
+        return resolved and self.pool.buffer(resolved)
+
+    @contextmanager
+    def lease(self, asset_path: str) -> Iterator[Optional[AssetBuffer]]:
+        """A pooled read-only buffer of an asset that isn't evicted until the block exits."""
+        resolved = self._acquire(asset_path)
+        if resolved is None:
+            yield None
+            return
+        with self.pool.lease(resolved) as result:
+            yield result
+
+    def _acquire(self, asset_path: str) -> Optional[str]:
+        resolved = self.resolve(asset_path)
+        if resolved is not None and resolved not in self._acquired:
+            self.pool.acquire(resolved)
+            self._acquired.add(resolved)
+        return resolved
+
+    @contextmanager
+    def open(self, asset_path: str) -> Iterator[Optional[AssetBuffer]]:
+        """A read-only buffer of an asset that's owned by the caller and closed on exit."""
+        resolved = self.resolve(asset_path)
+        result = resolved and _map(resolved)
+        try:
+            yield result
+        finally:
+            _close_buffer(result)
+
+    def close(self):
+        """Give back the pooled buffers of this manager's assets, buffers other managers use stay open."""
+        self.pool.release(self._acquired)
+        self._acquired.clear()
+
+    def __getstate__(self):
+        # The receiving side isn't a user of any pooled buffer yet
+        state = self.__dict__.copy()
+        state['_acquired'] = set()
+        return state
+
+    def __enter__(self) -> 'AssetManager':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,61 @@
+"""Asynchronous entry points to the parser, for use from within an event loop."""
+import asyncio
+from concurrent.futures import Executor
+from typing import AsyncIterator, Iterable, Optional, TextIO, Tuple, Union
+
+from .simfile_parser import Simfile, parse
+
+SimfileSource = Union[str, TextIO]
+
+
+async def parse_async(file: SimfileSource, executor: Optional[Executor] = None) -> Simfile:
+    """Parse a simfile without blocking the event loop.
+
+    Reading and parsing are offloaded to `executor`, or to the loop's default executor if it's None.
+    Process pools only accept paths, as open files can't be sent to another process."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, parse, file)
+
+
+async def parse_many_async(files: Iterable[SimfileSource],
+                           executor: Optional[Executor] = None,
+                           concurrency: int = 4,
+                           return_exceptions: bool = False
+                           ) -> AsyncIterator[Tuple[SimfileSource, Union[Simfile, BaseException]]]:
+    """Parse simfiles concurrently, yielding `(file, simfile)` pairs in order of completion.
+
+    At most `concurrency` files are read or parsed at any given time, and `files` is consumed lazily.
+    If `return_exceptions` is set, a failed parse yields `(file, exception)` instead of raising.
+
+    Closing the iterator or cancelling the task consuming it cancels every pending parse,
+    though parses already running in a thread can't be interrupted and finish in the background."""
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    files = iter(files)
+    pending = {}
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    file = next(files)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    pending[asyncio.ensure_future(parse_async(file, executor))] = file
+
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                file = pending.pop(task)
+                if return_exceptions and task.exception() is not None:
+                    yield file, task.exception()
+                else:
+                    yield file, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,8 +1,12 @@
 from collections import OrderedDict
 from enum import Enum, unique
 from fractions import Fraction
-from functools import wraps
-from typing import Union, get_type_hints
+from functools import lru_cache, wraps
+from sys import hash_info
+from typing import Optional, Union, get_type_hints
+
+_PyHASH_MODULUS = hash_info.modulus
+_PyHASH_INF = hash_info.inf
 
 
 def ensure_simple_return_type(func):
@@ -23,6 +27,7 @@ def ensure_simple_return_type(func):
 
 class CheaperFraction(Fraction):
     """A version of Fraction that has a faster hash function and renewal."""
+    __slots__ = ()
 
     def __new__(cls, numerator=0, denominator=None, *, _normalize=True):
         if numerator.__class__ == cls:
@@ -31,14 +36,33 @@ class CheaperFraction(Fraction):
         return super().__new__(cls, numerator=numerator, denominator=denominator, _normalize=_normalize)
 
     def __hash__(self) -> int:
-        n = 2 * self._numerator
-        if n < 0:
-            n = -n + 1
-        d = self.denominator
-        return ((n + d) * (n + d + 1) + d) // 2
+        """Same as hash(Fraction), so equal ints, Fractions and positions are interchangeable as keys,
+        but with the modular inverse of the denominator cached."""
+        denominator = self._denominator
+        if denominator == 1:
+            return hash(self._numerator)
+
+        inverse = _hash_inverse(denominator)
+        if inverse is None:
+            result = _PyHASH_INF
+        else:
+            result = hash(hash(abs(self._numerator)) * inverse)
+        if self._numerator < 0:
+            result = -result
+        return -2 if result == -1 else result
+
+
+@lru_cache(4096)
+def _hash_inverse(denominator: int) -> Optional[int]:
+    try:
+        return pow(denominator, -1, _PyHASH_MODULUS)
+    except ValueError:
+        return None
 
 
 class Invariant(CheaperFraction):
+    __slots__ = ()
+
     def __new__(cls, *args, **kwargs):
         result = super().__new__(cls, *args, **kwargs)
         result.__class__.__new__ = None
@@ -59,6 +83,7 @@ class Invariant(CheaperFraction):
 
 class BPM(CheaperFraction):
     """Beats-per-Minute, a unit of frequency used to define the rate of row advancement"""
+    __slots__ = ()
 
     @property
     def measures_per_second(self) -> CheaperFraction:
@@ -73,7 +98,7 @@ class Measure(CheaperFraction):
     """A positional continuous unit of time in charts, it composes a chart.
 
     Equivalent to Fraction."""
-    pass
+    __slots__ = ()
 
 
 class Beat(CheaperFraction):
@@ -83,6 +108,7 @@ class Beat(CheaperFraction):
 
     As time signature changes are not used and don't work in SM in general,
     Beat and Measure are equivalent and it's recommended to stick to Measure for positioning."""
+    __slots__ = ()
 
     @property
     def as_measure(self) -> Measure:
@@ -97,7 +123,7 @@ class LocalPosition(CheaperFraction):
     For SM and its derivatives the following constraints apply:
     0 <= LocalPosition < 1,
     1 <= LocalPosition.denominator <= 192"""
-    pass
+    __slots__ = ()
 
 
 class GlobalPosition(CheaperFraction):
@@ -108,6 +134,7 @@ class GlobalPosition(CheaperFraction):
     For SM and its derivatives the following constraints apply:
     0 <= GlobalPosition
     1 <= GlobalPosition.denominator <= 192"""
+    __slots__ = ()
 
     @property
     def measure(self) -> int:
@@ -124,6 +151,7 @@ class GlobalPosition(CheaperFraction):
 
 class Time(CheaperFraction):
     """A continuous unit of real time, in seconds."""
+    __slots__ = ()
 
     @property
     def limited_precision(self) -> 'Time':
@@ -132,21 +160,21 @@ class Time(CheaperFraction):
 
 
 class PositionInvariant(GlobalPosition, Invariant):
-    pass
+    __slots__ = ()
 
 
 PositionInvariant = PositionInvariant()
 
 
 class TimeInvariant(Time, Invariant):
-    pass
+    __slots__ = ()
 
 
 TimeInvariant = TimeInvariant()
 
 
 class DeltaInvariant(Time, Invariant):
-    pass
+    __slots__ = ()
 
 
 DeltaInvariant = DeltaInvariant()
@@ -168,6 +196,9 @@ class NoteObject(Enum):
     HOLD_BODY = 'H'
     ROLL_BODY = 'R'
 
+    # Members are singletons, so hashing by identity is consistent with equality and much faster than by name
+    __hash__ = object.__hash__
+
     @classmethod
     def get_from_character(cls, character: str) -> 'NoteObject':
         return cls._value2member_map_[character]
@@ -187,15 +218,22 @@ class Snap(Enum):
 
     @classmethod
     def from_position(cls, position: Union[LocalPosition, GlobalPosition]) -> 'Snap':
-        try:
-            cls._value2member_map_[1]
-        except KeyError:
-            cls._value2member_map_[1] = cls.RED
-            cls._value2member_map_[2] = cls.RED
-            cls._value2member_map_[3] = cls.VIOLET
-            cls._value2member_map_[6] = cls.VIOLET
-
-        return cls._lookup.get(position.denominator, cls.GRAY)
+        return cls.from_denominator(position.denominator)
+
+    @classmethod
+    def from_denominator(cls, denominator: int) -> 'Snap':
+        """The coarsest snap whose grid has positions with this denominator, GRAY if none does."""
+        return cls._lookup.get(denominator, cls.GRAY)
+
+
+Snap._lookup = {
+    denominator: min(
+        (snap for snap in Snap if snap.value % denominator == 0),
+        key=lambda snap: snap.value
+    )
+    for denominator in range(1, Snap.GRAY.value + 1)
+    if Snap.GRAY.value % denominator == 0
+}
 
 
 NullGlobalPosition = GlobalPosition(-1)
@@ -1,15 +1,24 @@
 import collections
-from functools import lru_cache
-from itertools import groupby, permutations
-from operator import attrgetter
-from typing import Counter, FrozenSet, Generic, List, Tuple, TypeVar, Union, cast
-
-from attr import attrs, evolve
-
-from .basic_types import Beat, CheaperFraction, NoteObject, Time, make_ordered_set
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, reduce
+from hashlib import blake2b
+from itertools import permutations
+from math import ceil, gcd, nan
+from multiprocessing.shared_memory import SharedMemory
+from operator import attrgetter, itemgetter
+from os import cpu_count
+from typing import Counter, Dict, FrozenSet, Generic, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, \
+    Union, cast
+
+from attr import attrs
+
+from .basic_types import Beat, GlobalPosition, LocalPosition, NoteObject, Snap, Time, make_ordered_set
 from .complex_types import MeasureBPMPair, MeasureMeasurePair
 from .rows import DECORATIVE_SET, GlobalDeltaRow, GlobalRow, GlobalTimedRow, HasPosition, HasRow, HasTime, \
-    LONG_NOTE_SET, PureRow, RowFlags
+    LONG_NOTE_SET, PureRow, RowFlags, judged_note_count
+from .timing import TimingEdit, TimingSegments
 
 # PureNotefield - PureRow --> HasRow
 # UntimedNotefield - GlobalRow --> HasRow, HasPosition
@@ -22,7 +31,7 @@ from .rows import DECORATIVE_SET, GlobalDeltaRow, GlobalRow, GlobalTimedRow, Has
 T = TypeVar('T', HasRow, HasPosition, HasTime)
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True)
 class MetaRow(Generic[T]):
     """Final evolutionary stage of rows, with attached metadata."""
     _row: T
@@ -89,7 +98,7 @@ class PureNotefield(Generic[T], AbstractNotefield[Union[T, PureRow]], List[PureR
                 new_note_field.append(PureRow(new_pure_row))
             else:
                 new_note_field.append(
-                    evolve(cast(T, row), row=PureRow(new_pure_row))
+                    cast(T, row).with_row(PureRow(new_pure_row))
                 )
 
             active_holds |= row.row.find_object_lanes(NoteObject.HOLD_START)
@@ -131,54 +140,73 @@ class PureNotefield(Generic[T], AbstractNotefield[Union[T, PureRow]], List[PureR
             for row in self
         )
 
+    @property
+    def lanes(self) -> int:
+        return len(self[0].row) if self else 0
+
+    def _unique_rows(self) -> Tuple[List[PureRow], List[int]]:
+        """Distinct pure rows, and the index among them of each row."""
+        unique_indices = {}
+        indices = [
+            unique_indices.setdefault(row.row, len(unique_indices))
+            for row in self
+        ]
+        return list(unique_indices), indices
+
+    def _remapped(self, permutation: Sequence[int], unique_rows: List[PureRow], indices: List[int]):
+        if len(permutation) == 1:
+            return self.__class__(self)
+
+        remap = itemgetter(*permutation)
+        new_rows = [PureRow(remap(row)) for row in unique_rows]
+        return self.__class__(
+            row.with_row(new_rows[index])
+            for row, index in zip(self, indices)
+        )
+
+    def permute_lanes(self, permutation: Sequence[int]) -> 'PureNotefield[T]':
+        """A copy where lane `i` has what lane `permutation[i]` had.
+
+        Each distinct row is remapped once, positions and times are shared with this notefield."""
+        if not self:
+            return self.__class__()
+        return self._remapped(permutation, *self._unique_rows())
+
+    def switch_lanes(self, lane_map: Dict[int, int]) -> 'PureNotefield[T]':
+        """Same as `HasRow.switch_lanes` for every row, lanes missing from `lane_map` stay as they are."""
+        return self.permute_lanes([lane_map.get(lane, lane) for lane in range(self.lanes)])
+
+    @property
+    def mirror(self) -> 'PureNotefield[T]':
+        return self.permute_lanes(range(self.lanes - 1, -1, -1))
+
+    def lane_permutations(self,
+                          orders: Optional[Iterable[Sequence[int]]] = None
+                          ) -> Iterator[Tuple[Tuple[int, ...], 'PureNotefield[T]']]:
+        """Lazily yield `(permutation, permute_lanes(permutation))` for each permutation in `orders`,
+        by default every permutation of the lanes.
+
+        Distinct rows are found once for all permutations."""
+        if not self:
+            return
+
+        unique_rows, indices = self._unique_rows()
+        for permutation in permutations(range(self.lanes)) if orders is None else orders:
+            yield tuple(permutation), self._remapped(permutation, unique_rows, indices)
+
 
 class UntimedNotefield(Generic[T], PureNotefield[GlobalRow], List[GlobalRow]):
     def calculate_timings(self,
                           bpm_segments: List[MeasureBPMPair],
                           stop_segments: List[MeasureMeasurePair],
                           offset: Time) -> 'TimedNotefield':
-        bpm_segments = collections.deque(sorted(bpm_segments, key=attrgetter('measure')))
-        stop_segments = collections.deque(sorted(stop_segments, key=attrgetter('measure')))
-        note_field_deque = collections.deque(sorted(self, key=attrgetter('pos')))
-
-        elapsed_time = 0
-        last_measure = 0
-        last_bpm = bpm_segments.popleft()
-        next_stop = stop_segments.popleft() if stop_segments else None
+        timing = TimingSegments(list(bpm_segments), list(stop_segments), offset)
+        note_field = sorted(self, key=attrgetter('pos'))
 
-        new_note_field = []
-        while note_field_deque:
-            last_object = note_field_deque.popleft()
-            delta_measure = last_object.pos - last_measure
-
-            delta_time = 0
-            while True:
-                next_bpm = bpm_segments[0] if bpm_segments else None
-
-                if next_bpm and next_bpm.measure < last_object.pos:
-                    delta_timing = next_bpm.measure - last_measure
-                    delta_time += last_bpm.bpm.measures_per_second * delta_timing
-                    delta_measure -= delta_timing
-                    last_bpm = bpm_segments.popleft()
-                    last_measure = last_bpm.measure
-                else:
-                    break
-
-            delta_time += last_bpm.bpm.measures_per_second * delta_measure
-
-            while True:
-                if next_stop and next_stop.measure < last_measure + delta_measure:
-                    delta_time += CheaperFraction(next_stop.value, last_bpm.bpm.measures_per_second)
-                    next_stop = stop_segments.popleft() if stop_segments else None
-                else:
-                    break
-
-            elapsed_time += delta_time
-            last_measure += delta_measure
-
-            new_note_field.append(
-                last_object.evolve(Time(elapsed_time - offset))
-            )
+        new_note_field = [
+            row.evolve(time)
+            for row, time in zip(note_field, timing.times_at(row.pos for row in note_field))
+        ]
 
         return TimedNotefield(new_note_field)
 
@@ -192,27 +220,223 @@ class UntimedNotefield(Generic[T], PureNotefield[GlobalRow], List[GlobalRow]):
     @property
     def no_decorative_elements(self) -> 'UntimedNotefield[T]':
         return self.__class__(
-            evolve(row, row=row.row.replace_objects({NoteObject.MINE, NoteObject.FAKE},
-                                                    NoteObject.EMPTY_LANE))
+            row.with_row(row.row.replace_objects({NoteObject.MINE, NoteObject.FAKE},
+                                                 NoteObject.EMPTY_LANE))
             for row in self
         )
 
-    def row_sequence_by_beats(self, beat_window=1) -> 'SequentialNotefield[RowSequence[T, ...]]':
-        def group(row):
-            return int(row.pos / Beat(beat_window).as_measure)
+    @property
+    def tick_resolution(self) -> int:
+        """The smallest amount of ticks per measure that puts every row on a whole tick."""
+        resolution = 1
+        for denominator in {row.pos.denominator for row in self}:
+            resolution = resolution * denominator // gcd(resolution, denominator)
+        return resolution
+
+    def ticks(self, resolution: int) -> List[int]:
+        """Positions of rows as whole ticks, `resolution` ticks per measure, see `tick_resolution`."""
+        return [
+            row.pos.numerator * (resolution // row.pos.denominator)
+            for row in self
+        ]
 
-        result = [
-            RowSequence(
-                obj.localize(Beat(beat_window).as_measure)
-                for obj in group
+    def iter_row_sequences(self, beat_window=1, stride=None) -> Iterator['RowSequence[T]']:
+        """Lazily group rows into windows `beat_window` beats long, a new window starting every `stride` beats.
+
+        By default windows are adjacent, they overlap if `stride` is shorter than `beat_window`.
+        Empty windows are skipped and rows are localized relative to the start of their window.
+        Rows have to be sorted by position."""
+        window = Beat(beat_window).as_measure
+        stride = window if stride is None else Beat(stride).as_measure
+
+        resolution = self.tick_resolution
+        for denominator in (window.denominator, stride.denominator):
+            resolution = resolution * denominator // gcd(resolution, denominator)
+
+        window_ticks = int(window * resolution)
+        stride_ticks = int(stride * resolution)
+        ticks = self.ticks(resolution)
+
+        def first_window_from(index):
+            """First window that contains the row at `index`."""
+            return max((ticks[index] - window_ticks) // stride_ticks + 1, 0)
+
+        low = 0
+        window_index = ticks and first_window_from(0)
+        while low < len(ticks):
+            start = window_index * stride_ticks
+            low = bisect_left(ticks, start, low)
+            high = bisect_left(ticks, start + window_ticks, low)
+
+            if low == high:
+                if low < len(ticks):
+                    window_index = first_window_from(low)
+                continue
+
+            yield RowSequence(
+                row.with_position(LocalPosition(tick - start, window_ticks))
+                for row, tick in zip(self[low:high], ticks[low:high])
             )
-            for _, group in groupby(self, group)
+            window_index += 1
+
+    def row_sequence_by_beats(self, beat_window=1, stride=None) -> 'SequentialNotefield[RowSequence[T, ...]]':
+        return SequentialNotefield(self.iter_row_sequences(beat_window, stride))
+
+    def fingerprint(self, mirror_invariant: bool = False, lane_invariant: bool = False) -> bytes:
+        """A digest of the normalized notefield and the positions of rows relative to the first one.
+
+        It doesn't depend on offset, timing or where the chart starts, so it identifies re-uploads of the same chart.
+        With `mirror_invariant`, a chart and its mirror have the same fingerprint,
+        with `lane_invariant`, so do all charts that differ only by a permutation of lanes.
+        For that, lanes are put in the order of their columns, which is the same for any permutation of them,
+        and the chart is hashed once in that order."""
+        note_field = self.normalized
+        if not note_field:
+            return blake2b(b'', digest_size=16).digest()
+
+        start = note_field[0].pos
+        positions = [
+            '{}/{}'.format(relative.numerator, relative.denominator)
+            for relative in (row.pos - start for row in note_field)
         ]
+        rows = [row.row.str_row for row in note_field]
+
+        lanes = len(note_field[0].row)
+        if lane_invariant:
+            columns = [''.join(row[lane] for row in rows) for lane in range(lanes)]
+            lane_maps = [tuple(sorted(range(lanes), key=columns.__getitem__))]
+        elif mirror_invariant:
+            lane_maps = [tuple(range(lanes)), tuple(reversed(range(lanes)))]
+        else:
+            lane_maps = [tuple(range(lanes))]
+
+        digests = []
+        for lane_map in lane_maps:
+            # Rows repeat a lot, so each distinct row is permuted only once
+            permuted_rows = {
+                row: ''.join(row[lane] for lane in lane_map)
+                for row in set(rows)
+            }
+            encoded = ';'.join(
+                '{}:{}'.format(position, permuted_rows[row])
+                for position, row in zip(positions, rows)
+            )
+            digests.append(blake2b(encoded.encode(), digest_size=16).digest())
+
+        return min(digests)
+
+    def snap_histogram(self, skip_empty: bool = True) -> Counter[Snap]:
+        """How many rows fall on each snap, in a single pass over whole ticks.
+
+        Rows that don't fall on any common snap are counted as GRAY."""
+        resolution = self.tick_resolution
+        denominators = collections.Counter(
+            resolution // gcd(tick, resolution)
+            for tick, row in zip(self.ticks(resolution), self)
+            if not skip_empty or row.row.count(NoteObject.EMPTY_LANE) != len(row.row)
+        )
+
+        result = collections.Counter()
+        for denominator, count in denominators.items():
+            result[Snap.from_denominator(denominator)] += count
+        return result
+
+    def resnap(self, snap: Snap) -> Tuple['UntimedNotefield[GlobalRow]', List['SnapCollision']]:
+        """Move every row to the nearest position on the grid of `snap`, rounding halfway positions up.
+
+        Rows that end up on the same position are merged, keeping the first non-empty object of every lane,
+        and non-empty rows merged this way are reported as collisions.
+        Times aren't carried over, the result has to be timed anew."""
+        resolution = self.tick_resolution
+        grid = snap.value
+
+        merged_rows = collections.OrderedDict()
+        for row, tick in zip(self, self.ticks(resolution)):
+            new_tick = (2 * tick * grid + resolution) // (2 * resolution)
+            merged_rows.setdefault(new_tick, []).append(row)
+
+        new_note_field = UntimedNotefield()
+        collisions = []
+        for new_tick, rows in merged_rows.items():
+            position = GlobalPosition(new_tick, grid)
+            new_row = rows[0].row
+            if len(rows) > 1:
+                new_row, collision = SnapCollision.merge(position, rows)
+                if collision:
+                    collisions.append(collision)
+
+            new_note_field.append(GlobalRow(new_row, position))
+
+        return new_note_field, collisions
+
 
-        return SequentialNotefield(result)
+@attrs(frozen=True, auto_attribs=True)
+class SnapCollision(object):
+    """Non-empty rows that were merged into one position by resnapping.
+
+    `conflicting_lanes` are lanes where the rows had different non-empty objects, only the first one was kept."""
+    position: GlobalPosition
+    rows: Tuple[GlobalRow, ...]
+    conflicting_lanes: FrozenSet[int]
+
+    @classmethod
+    def merge(cls, position: GlobalPosition, rows: List[GlobalRow]) -> Tuple[PureRow, Optional['SnapCollision']]:
+        """Merge rows into a single row, along with the collision it caused, if any."""
+        non_empty_rows = tuple(
+            row
+            for row in rows
+            if not row.is_empty
+        )
+
+        new_row = list(rows[0].row)
+        conflicting_lanes = set()
+        for row in non_empty_rows:
+            for lane, obj in enumerate(row.row):
+                if obj is NoteObject.EMPTY_LANE:
+                    continue
+                if new_row[lane] is NoteObject.EMPTY_LANE:
+                    new_row[lane] = obj
+                elif new_row[lane] is not obj:
+                    conflicting_lanes.add(lane)
+
+        collision = len(non_empty_rows) > 1 and cls(position, non_empty_rows, frozenset(conflicting_lanes)) or None
+        return PureRow(new_row), collision
 
 
 class TimedNotefield(Generic[T], UntimedNotefield[GlobalTimedRow], List[GlobalTimedRow]):
+    def _index_after(self, position) -> int:
+        """Index of the first row strictly after `position`, rows being sorted by position."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if position < self[middle].pos:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def time_index(self) -> 'TimeIndex':
+        """An index for finding rows by time, rows have to be sorted by position as `calculate_timings` leaves them."""
+        return TimeIndex(self)
+
+    def apply_timing_edit(self, timing: TimingSegments, edit: TimingEdit):
+        """Update the times in place after `timing` was edited, touching only rows after the edit.
+
+        Rows have to be sorted by position, as `calculate_timings` leaves them."""
+        start = self._index_after(edit.since)
+        stop = len(self) if edit.until is None else self._index_after(edit.until)
+
+        new_times = timing.times_at(row.pos for row in self[start:stop])
+        for index, time in enumerate(new_times, start=start):
+            row = self[index]
+            self[index] = row.with_time(time)
+
+        shift = edit.shift
+        if shift:
+            for index in range(stop, len(self)):
+                row = self[index]
+                self[index] = row.with_time(Time(row.time + shift))
+
     @property
     def time_invariant(self):
         return self.__class__(
@@ -223,7 +447,7 @@ class TimedNotefield(Generic[T], UntimedNotefield[GlobalTimedRow], List[GlobalTi
     @property
     def discrete_time(self) -> 'TimedNotefield':
         return self.__class__(
-            evolve(row, time=row.time.limited_precision)
+            row.with_time(row.time.limited_precision)
             for row in self
         )
 
@@ -276,7 +500,7 @@ class TimedNotefield(Generic[T], UntimedNotefield[GlobalTimedRow], List[GlobalTi
             return obj == NoteObject.HOLD_START and NoteObject.TAP_OBJECT or NoteObject.EMPTY_LANE
 
         return self.__class__(
-            evolve(row, row=PureRow(new_object(obj, index, lane)
+            row.with_row(PureRow(new_object(obj, index, lane)
                                     for lane, obj in enumerate(row.row)))
             for index, row in enumerate(self)
         )
@@ -289,6 +513,41 @@ class TimedNotefield(Generic[T], UntimedNotefield[GlobalTimedRow], List[GlobalTi
         return DeltaNotefield(delta_rows)
 
 
+class TimeIndex(object):
+    """Times of the rows of a timed notefield as floats, to find rows by time with a bisection.
+
+    The index is a snapshot, build a new one after the notefield or its timing is edited.
+    It's read-only, so one index can serve any amount of readers."""
+
+    def __init__(self, note_field: TimedNotefield):
+        self.note_field = note_field
+        self.times = array('d', (float(row.time) for row in note_field))
+        if any(earlier > later for earlier, later in zip(self.times, self.times[1:])):
+            raise ValueError('Rows have to be sorted by time')
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_at(self, time: Union[Time, float]) -> int:
+        """Index of the first row at or after `time`."""
+        return bisect_left(self.times, float(time))
+
+    def range_between(self, start: Union[Time, float], stop: Union[Time, float]) -> range:
+        """Indices of the rows at or after `start` and before `stop`."""
+        first = bisect_left(self.times, float(start))
+        return range(first, bisect_left(self.times, float(stop), first))
+
+    def rows_between(self, start: Union[Time, float], stop: Union[Time, float]) -> TimedNotefield:
+        """Rows at or after `start` and before `stop`."""
+        indices = self.range_between(start, stop)
+        return self.note_field.__class__(self.note_field[indices.start:indices.stop])
+
+    def row_at(self, time: Union[Time, float]) -> Optional[GlobalTimedRow]:
+        """The last row at or before `time`, None if there's none."""
+        index = bisect_right(self.times, float(time)) - 1
+        return self.note_field[index] if index >= 0 else None
+
+
 class DeltaNotefield(Generic[T], TimedNotefield[GlobalDeltaRow], List[GlobalDeltaRow]):
     @property
     def delta_invariant(self):
@@ -356,9 +615,175 @@ class SequentialNotefield(Generic[T], AbstractNotefield[RowSequence[T]], List[Ro
 
 
 class MetaNotefield(Generic[T], AbstractNotefield[MetaRow], List[MetaRow]):
-    pass
+    @classmethod
+    def from_notefield(cls, note_field: UntimedNotefield) -> 'MetaNotefield':
+        """Classify every row of a notefield, only 4 lanes are supported."""
+        return cls(
+            MetaRow.from_row(row)
+            for row in note_field
+        )
+
+
+@attrs(frozen=True, auto_attribs=True)
+class ChartArrays(object):
+    """Flat views on the rows of one notefield of a `BatchOperations`.
+
+    Row `i` is `codes[i]` (see `PureRow.code`) at position `numerators[i] / denominators[i]`
+    and time `times[i]`, NaN for rows that aren't timed.
+    The views are only valid during the call they're passed to, so don't return them."""
+    lanes: int
+    codes: memoryview
+    numerators: memoryview
+    denominators: memoryview
+    times: memoryview
+
+    def __len__(self):
+        return len(self.codes)
+
+    def pure_row(self, index: int) -> PureRow:
+        return PureRow.from_code(self.codes[index], self.lanes)
+
+
+_BATCH_FORMATS = ('q', 'q', 'q', 'd')
+_NO_INITIAL = object()
+
+
+def _open_batch(name: str, total_rows: int, charts: List[Tuple[int, int, int]]):
+    memory = SharedMemory(name)
+    item_size = 8 * total_rows
+    buffers = [
+        memory.buf[index * item_size:(index + 1) * item_size].cast(format_)
+        for index, format_ in enumerate(_BATCH_FORMATS)
+    ]
+    views = [
+        [buffer[start:stop] for buffer in buffers]
+        for _, start, stop in charts
+    ]
+    arrays = [
+        ChartArrays(lanes, *chart_views)
+        for (lanes, _, _), chart_views in zip(charts, views)
+    ]
+
+    def close():
+        for view in (*buffers, *(view for chart_views in views for view in chart_views)):
+            view.release()
+        memory.close()
+
+    return arrays, close
+
+
+def _map_batch(name: str, total_rows: int, charts: List[Tuple[int, int, int]], function) -> list:
+    arrays, close = _open_batch(name, total_rows, charts)
+    try:
+        return [function(chart) for chart in arrays]
+    finally:
+        close()
+
+
+def _reduce_batch(name: str, total_rows: int, charts: List[Tuple[int, int, int]], function, reducer):
+    return reduce(reducer, _map_batch(name, total_rows, charts, function))
 
 
-# from simfile_parser import AugmentedChart
 class BatchOperations(object):
-    pass
+    """Many notefields packed into shared memory, to run analyses on them in a pool of worker processes.
+
+    Only the name of the shared memory block and the bounds of each notefield are sent to workers,
+    which see each notefield as `ChartArrays` instead of unpickling rows.
+    Analysis functions and reducers have to be picklable, that is defined at the top level of a module.
+    Results always come in the order of the notefields, whatever the amount of processes."""
+
+    def __init__(self, note_fields: Iterable[UntimedNotefield]):
+        codes, numerators, denominators, times = (array(format_) for format_ in _BATCH_FORMATS)
+        self._charts: List[Tuple[int, int, int]] = []
+        for note_field in note_fields:
+            start = len(codes)
+            for row in note_field:
+                codes.append(row.code)
+                numerators.append(row.pos.numerator)
+                denominators.append(row.pos.denominator)
+                times.append(float(row.time) if isinstance(row, HasTime) else nan)
+            self._charts.append((note_field and len(note_field[0].row) or 0, start, len(codes)))
+
+        self._rows = len(codes)
+        self._memory = SharedMemory(create=True, size=max(8 * self._rows * len(_BATCH_FORMATS), 1))
+        for index, data in enumerate((codes, numerators, denominators, times)):
+            self._memory.buf[index * 8 * self._rows:(index + 1) * 8 * self._rows] = data.tobytes()
+
+    def __len__(self):
+        return len(self._charts)
+
+    def _chunks(self, processes: Optional[int], chunk_size: Optional[int]) -> List[List[Tuple[int, int, int]]]:
+        if chunk_size is None:
+            chunk_size = max(ceil(len(self._charts) / ((processes or cpu_count() or 1) * 4)), 1)
+        return [
+            self._charts[start:start + chunk_size]
+            for start in range(0, len(self._charts), chunk_size)
+        ]
+
+    def map(self, function, processes: Optional[int] = None, chunk_size: Optional[int] = None) -> list:
+        """Results of `function(ChartArrays)` for every notefield.
+
+        Notefields are sent to workers in chunks of `chunk_size`, by default 4 chunks per process."""
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(_map_batch, self._memory.name, self._rows, chunk, function)
+                for chunk in self._chunks(processes, chunk_size)
+            ]
+            return [
+                result
+                for future in futures
+                for result in future.result()
+            ]
+
+    def reduce(self, function, reducer, initial=_NO_INITIAL,
+               processes: Optional[int] = None, chunk_size: Optional[int] = None):
+        """Combine results of `function(ChartArrays)` for every notefield with `reducer`.
+
+        Each chunk is reduced in its worker and the results of chunks are reduced in order,
+        so the result doesn't depend on scheduling and only depends on `chunk_size` for non-associative reducers."""
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(_reduce_batch, self._memory.name, self._rows, chunk, function, reducer)
+                for chunk in self._chunks(processes, chunk_size)
+            ]
+            partials = [future.result() for future in futures]
+
+        if initial is _NO_INITIAL:
+            return reduce(reducer, partials)
+        return reduce(reducer, partials, initial)
+
+    def close(self):
+        """Free the shared memory, the batch can't be used after."""
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self) -> 'BatchOperations':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def code_counter(chart: ChartArrays) -> Counter[int]:
+    """How many times each row code occurs, decode them with `PureRow.from_code`."""
+    return collections.Counter(chart.codes)
+
+
+def snap_counter(chart: ChartArrays) -> Counter[Snap]:
+    """How many rows there are of each snap."""
+    return collections.Counter(map(Snap.from_denominator, chart.denominators))
+
+
+def peak_notes_per_second(chart: ChartArrays, window: float = 1.0) -> int:
+    """Most judged notes within any `window` seconds of a timed notefield."""
+    times = []
+    for code, time in zip(chart.codes, chart.times):
+        times.extend((time,) * judged_note_count(code, chart.lanes))
+
+    peak = 0
+    start = 0
+    for end, time in enumerate(times):
+        while times[start] <= time - window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
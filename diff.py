@@ -0,0 +1,208 @@
+"""Structural differences between two versions of a simfile or chart."""
+from collections import Counter
+from enum import Enum, unique
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+from attr import attrs, fields
+
+from .chart_analysis import UntimedNotefield
+from .rows import pack_row_key
+from .simfile_parser import PureChart, Simfile
+
+# Fields that aren't compared as a whole
+_NON_HEADER_FIELDS = frozenset({'meta', 'bpm_segments', 'stop_segments', 'charts', 'diagnostics'})
+
+
+@unique
+class EditKind(Enum):
+    ADDED = 'added'
+    REMOVED = 'removed'
+    CHANGED = 'changed'
+
+
+@attrs(frozen=True, auto_attribs=True)
+class Edit(object):
+    """A single difference, `path` locating what differs and `old`/`new` being the values on each side.
+
+    Paths look like:
+    ('title',) for headers, `meta` tags being ('meta', tag);
+    ('bpm_segments', measure) and ('stop_segments', measure) for segments;
+    ('charts', lanes, diff_name, occurrence) for whole charts, `occurrence` telling apart charts with the same
+    amount of lanes and difficulty slot, followed by a field name for their metadata or by 'measures' for their notes.
+    For measures, `old` and `new` are ranges of measure indices, the old ones being replaced by the new ones."""
+    kind: EditKind
+    path: Tuple[Hashable, ...]
+    old: object = None
+    new: object = None
+
+
+def _changes(path: Tuple[Hashable, ...], old: Dict, new: Dict) -> Iterable[Edit]:
+    for key in old.keys() - new.keys():
+        yield Edit(EditKind.REMOVED, (*path, key), old[key], None)
+    for key in new.keys() - old.keys():
+        yield Edit(EditKind.ADDED, (*path, key), None, new[key])
+    for key in old.keys() & new.keys():
+        if old[key] != new[key]:
+            yield Edit(EditKind.CHANGED, (*path, key), old[key], new[key])
+
+
+def measure_signatures(note_field: UntimedNotefield) -> List[Tuple]:
+    """A hashable signature of the contents of each measure, independent of where the measure is.
+
+    Rows have to be sorted by position, measures without rows have an empty signature."""
+    signatures = []
+    current = []
+    current_measure = 0
+    for row in note_field:
+        measure = row.pos.measure
+        while current_measure < measure:
+            signatures.append(tuple(current))
+            current = []
+            current_measure += 1
+
+        current.append(pack_row_key(row.row, row.pos - measure))
+
+    if current:
+        signatures.append(tuple(current))
+    return signatures
+
+
+def _myers_matches(old: Sequence, new: Sequence) -> List[Tuple[int, int]]:
+    """Pairs of indices of equal elements in a longest common subsequence, by Myers' O(ND) algorithm."""
+    old_length, new_length = len(old), len(new)
+    furthest = {1: 0}
+    trace = []
+    for distance in range(old_length + new_length + 1):
+        trace.append(dict(furthest))
+        for diagonal in range(-distance, distance + 1, 2):
+            if diagonal == -distance or (diagonal != distance and furthest[diagonal - 1] < furthest[diagonal + 1]):
+                x = furthest[diagonal + 1]
+            else:
+                x = furthest[diagonal - 1] + 1
+            y = x - diagonal
+            while x < old_length and y < new_length and old[x] == new[y]:
+                x += 1
+                y += 1
+            furthest[diagonal] = x
+
+            if x >= old_length and y >= new_length:
+                break
+        else:
+            continue
+        break
+
+    matches = []
+    x, y = old_length, new_length
+    for distance in reversed(range(len(trace))):
+        furthest = trace[distance]
+        diagonal = x - y
+        if diagonal == -distance or (diagonal != distance and furthest[diagonal - 1] < furthest[diagonal + 1]):
+            previous_diagonal = diagonal + 1
+        else:
+            previous_diagonal = diagonal - 1
+        previous_x = furthest[previous_diagonal]
+        previous_y = previous_x - previous_diagonal
+
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x, y = previous_x, previous_y
+
+    matches.reverse()
+    return matches
+
+
+def diff_sequences(old: Sequence[Hashable], new: Sequence[Hashable]) -> List[Tuple[range, range]]:
+    """Ranges of `old` to replace by ranges of `new` to turn `old` into `new`, in order.
+
+    The common prefix and suffix are skipped before running a Myers diff on what's left,
+    with elements replaced by small integers so that they're compared once each."""
+    prefix = 0
+    while prefix < len(old) and prefix < len(new) and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < len(old) - prefix and suffix < len(new) - prefix and
+           old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]):
+        suffix += 1
+
+    identifiers: Dict[Hashable, int] = {}
+    old_middle = [identifiers.setdefault(element, len(identifiers)) for element in old[prefix:len(old) - suffix]]
+    new_middle = [identifiers.setdefault(element, len(identifiers)) for element in new[prefix:len(new) - suffix]]
+
+    result = []
+    old_start = new_start = 0
+    for old_index, new_index in [*_myers_matches(old_middle, new_middle), (len(old_middle), len(new_middle))]:
+        if old_index > old_start or new_index > new_start:
+            result.append((range(prefix + old_start, prefix + old_index), range(prefix + new_start, prefix + new_index)))
+        old_start, new_start = old_index + 1, new_index + 1
+    return result
+
+
+def diff_charts(old: PureChart, new: PureChart, path: Tuple[Hashable, ...] = ()) -> List[Edit]:
+    """Differences between two versions of a chart, by metadata and then by measures.
+
+    Measures aren't compared when both charts were parsed from the same `#NOTES` block, see `PureChart.source_digest`."""
+    edits = [
+        Edit(EditKind.CHANGED, (*path, name), getattr(old, name), getattr(new, name))
+        for name in ('step_artist', 'diff_name', 'diff_value')
+        if getattr(old, name) != getattr(new, name)
+    ]
+
+    if old.source_digest is None or old.source_digest != new.source_digest:
+        for old_measures, new_measures in diff_sequences(measure_signatures(old.note_field),
+                                                         measure_signatures(new.note_field)):
+            if not old_measures:
+                kind = EditKind.ADDED
+            elif not new_measures:
+                kind = EditKind.REMOVED
+            else:
+                kind = EditKind.CHANGED
+            edits.append(Edit(kind, (*path, 'measures'), old_measures, new_measures))
+
+    return edits
+
+
+def _chart_keys(charts: Iterable[PureChart]) -> Dict[Tuple[int, str, int], PureChart]:
+    # By difficulty slot rather than meter, so that re-rating a chart is a change of `diff_value`
+    occurrences = Counter()
+    result = {}
+    for chart in charts:
+        slot = chart.lanes, chart.diff_name
+        result[(*slot, occurrences[slot])] = chart
+        occurrences[slot] += 1
+    return result
+
+
+def diff_simfiles(old: Simfile, new: Simfile) -> List[Edit]:
+    """Differences between two versions of a simfile: headers, timing segments, then charts.
+
+    Charts are aligned by amount of lanes and difficulty slot. Charts parsed from the same `#NOTES` block,
+    such as ones reused by `IncrementalParser`, are compared by metadata only."""
+    edits = [
+        Edit(EditKind.CHANGED, (field.name,), getattr(old, field.name), getattr(new, field.name))
+        for field in fields(Simfile)
+        if not field.name.startswith('_') and field.name not in _NON_HEADER_FIELDS
+        if getattr(old, field.name) != getattr(new, field.name)
+    ]
+    edits.extend(_changes(('meta',), old.meta, new.meta))
+
+    edits.extend(_changes(('bpm_segments',),
+                          {segment.measure: segment.bpm for segment in old.bpm_segments},
+                          {segment.measure: segment.bpm for segment in new.bpm_segments}))
+    edits.extend(_changes(('stop_segments',),
+                          {segment.measure: segment.value for segment in old.stop_segments},
+                          {segment.measure: segment.value for segment in new.stop_segments}))
+
+    old_charts = _chart_keys(old.charts)
+    new_charts = _chart_keys(new.charts)
+    for key, chart in old_charts.items():
+        if key not in new_charts:
+            edits.append(Edit(EditKind.REMOVED, ('charts', *key), chart, None))
+    for key, chart in new_charts.items():
+        if key not in old_charts:
+            edits.append(Edit(EditKind.ADDED, ('charts', *key), None, chart))
+        else:
+            edits.extend(diff_charts(old_charts[key], chart, ('charts', *key)))
+
+    return edits
@@ -0,0 +1,183 @@
+"""A sparse representation of notefields, as note events and hold/roll intervals."""
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from attr import attrs
+
+from .basic_types import GlobalPosition, NoteObject, Time
+from .chart_analysis import TimedNotefield, UntimedNotefield
+from .rows import CODE_OBJECTS, EMPTY_LANE_SET, GlobalRow, GlobalTimedRow, HasTime, LONG_NOTE_BODY_SET, \
+    OBJECT_CODES, PureRow
+
+# Objects that aren't kept as events, bodies are implied by long notes
+_SKIPPED_OBJECTS = EMPTY_LANE_SET | LONG_NOTE_BODY_SET
+
+
+class NoteEvent(NamedTuple):
+    """An object on a lane, at `tick` out of `EventField.resolution` ticks per measure."""
+    tick: int
+    lane: int
+    obj: NoteObject
+    time: Optional[Time]
+
+
+@attrs(frozen=True, auto_attribs=True)
+class LongNote(object):
+    """A hold or a roll, from the tick of its head to the tick of its end."""
+    lane: int
+    start: int
+    end: int
+    is_roll: bool
+    start_time: Optional[Time] = None
+    end_time: Optional[Time] = None
+
+
+class _LaneIntervals(object):
+    """Long notes of a lane sorted by start, as they never overlap only the last one starting at or before
+    a point can contain it."""
+
+    def __init__(self, long_notes: List[LongNote], timed: bool):
+        self.long_notes = long_notes
+        self.starts = array('q', (long_note.start for long_note in long_notes))
+        self.start_times = array('d', (float(long_note.start_time) for long_note in long_notes) if timed else ())
+        self.end_times = array('d', (float(long_note.end_time) for long_note in long_notes) if timed else ())
+
+    def at_tick(self, tick: int) -> Optional[LongNote]:
+        index = bisect_right(self.starts, tick) - 1
+        if index >= 0 and tick <= self.long_notes[index].end:
+            return self.long_notes[index]
+        return None
+
+    def at_time(self, time: float) -> Optional[LongNote]:
+        index = bisect_right(self.start_times, time) - 1
+        if index >= 0 and time <= self.end_times[index]:
+            return self.long_notes[index]
+        return None
+
+
+class EventField(object):
+    """A notefield stored as its non-empty objects sorted by position, along with its holds and rolls as intervals.
+
+    Storage grows with the amount of objects rather than rows times lanes.
+    Events are indexed by object and lane, and long notes by lane,
+    so looking them up is a bisection instead of a scan of the rows."""
+
+    def __init__(self,
+                 lanes: int,
+                 resolution: int,
+                 events: List[NoteEvent],
+                 long_notes: List[LongNote]):
+        self.lanes = lanes
+        self.resolution = resolution
+        self.timed = bool(events) and events[0].time is not None
+
+        self._ticks = array('q', (event.tick for event in events))
+        self._lanes = array('b', (event.lane for event in events))
+        self._codes = array('b', (OBJECT_CODES[event.obj] for event in events))
+        self._times: Optional[List[Time]] = [event.time for event in events] if self.timed else None
+
+        # (object, lane or None) to the indices and ticks of its events
+        self._by_object: Dict[Tuple[NoteObject, Optional[int]], Tuple[array, array]] = {}
+        for index, event in enumerate(events):
+            for key in ((event.obj, event.lane), (event.obj, None)):
+                indices, ticks = self._by_object.setdefault(key, (array('q'), array('q')))
+                indices.append(index)
+                ticks.append(event.tick)
+
+        self.long_notes = long_notes
+        self._intervals = [
+            _LaneIntervals([long_note for long_note in long_notes if long_note.lane == lane], self.timed)
+            for lane in range(lanes)
+        ]
+
+    @classmethod
+    def from_notefield(cls, note_field: UntimedNotefield) -> 'EventField':
+        """Events of a notefield sorted by position, timed if its rows are.
+
+        Hold and roll bodies are left out, heads without an end aren't turned into long notes.
+        Rows have to be sorted by position."""
+        if not note_field:
+            return cls(0, 1, [], [])
+
+        resolution = note_field.tick_resolution
+        events = []
+        long_notes = []
+        open_long_notes: Dict[int, NoteEvent] = {}
+        for row, tick in zip(note_field, note_field.ticks(resolution)):
+            time = row.time if isinstance(row, HasTime) else None
+            for lane, obj in enumerate(row.row):
+                if obj in _SKIPPED_OBJECTS:
+                    continue
+
+                event = NoteEvent(tick, lane, obj, time)
+                events.append(event)
+                if obj is NoteObject.HOLD_START or obj is NoteObject.ROLL_START:
+                    open_long_notes[lane] = event
+                elif obj is NoteObject.HOLD_ROLL_END and lane in open_long_notes:
+                    head = open_long_notes.pop(lane)
+                    long_notes.append(LongNote(lane, head.tick, tick, head.obj is NoteObject.ROLL_START,
+                                               head.time, time))
+
+        long_notes.sort(key=lambda long_note: (long_note.start, long_note.lane))
+        return cls(len(note_field[0].row), resolution, events, long_notes)
+
+    def __len__(self):
+        return len(self._ticks)
+
+    def __getitem__(self, index: int) -> NoteEvent:
+        return NoteEvent(self._ticks[index],
+                         self._lanes[index],
+                         CODE_OBJECTS[self._codes[index]],
+                         self._times[index] if self.timed else None)
+
+    def __iter__(self) -> Iterator[NoteEvent]:
+        return map(self.__getitem__, range(len(self)))
+
+    def events_of(self,
+                  obj: NoteObject,
+                  lane: Optional[int] = None,
+                  start: Optional[int] = None,
+                  stop: Optional[int] = None) -> List[NoteEvent]:
+        """Events of an object, on any lane if `lane` is None, with ticks from `start` until `stop` excluded."""
+        indices, ticks = self._by_object.get((obj, lane), ((), ()))
+        first = 0 if start is None else bisect_left(ticks, start)
+        last = len(ticks) if stop is None else bisect_left(ticks, stop, first)
+        return [self[index] for index in indices[first:last]]
+
+    def events_between(self, start: int, stop: int) -> List[NoteEvent]:
+        """Events with ticks from `start` until `stop` excluded."""
+        first = bisect_left(self._ticks, start)
+        return [self[index] for index in range(first, bisect_left(self._ticks, stop, first))]
+
+    def long_notes_at(self, tick: int) -> List[LongNote]:
+        """Holds and rolls held at `tick`, ends included."""
+        long_notes = (intervals.at_tick(tick) for intervals in self._intervals)
+        return [long_note for long_note in long_notes if long_note is not None]
+
+    def long_notes_at_time(self, time: Union[Time, float]) -> List[LongNote]:
+        """Holds and rolls held at `time`, in seconds, which requires a timed notefield."""
+        if not self.timed:
+            raise ValueError('Looking up by time requires a timed notefield')
+        long_notes = (intervals.at_time(float(time)) for intervals in self._intervals)
+        return [long_note for long_note in long_notes if long_note is not None]
+
+    def to_notefield(self) -> UntimedNotefield:
+        """Rows of the events, timed if they are, without the rows that were empty.
+
+        Hold and roll bodies aren't filled in, as in the notefields given by the parser."""
+        rows = []
+        for tick, indices in groupby(range(len(self)), key=self._ticks.__getitem__):
+            indices = list(indices)
+            row_objects = [NoteObject.EMPTY_LANE] * self.lanes
+            for index in indices:
+                row_objects[self._lanes[index]] = CODE_OBJECTS[self._codes[index]]
+            rows.append(self._make_row(tick, row_objects, self._times[indices[0]] if self.timed else None))
+        return (TimedNotefield if self.timed else UntimedNotefield)(rows)
+
+    def _make_row(self, tick: int, objects: List[NoteObject], time: Optional[Time]):
+        position = GlobalPosition(tick, self.resolution)
+        if time is None:
+            return GlobalRow(PureRow(objects), position)
+        return GlobalTimedRow(PureRow(objects), position, time)
@@ -0,0 +1,186 @@
+"""Dense feature tensors of charts, for feeding machine learning models."""
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from math import floor
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from attr import attrs
+
+from .basic_types import NoteObject
+from .chart_analysis import TimedNotefield, UntimedNotefield
+from .rows import LONG_NOTE_BODY_SET
+from .simfile_parser import PureChart, parse
+
+FEATURE_OBJECTS = (
+    NoteObject.TAP_OBJECT,
+    NoteObject.HOLD_START,
+    NoteObject.ROLL_START,
+    NoteObject.HOLD_ROLL_END,
+    NoteObject.MINE,
+    NoteObject.LIFT,
+    NoteObject.FAKE,
+)
+
+
+@attrs(frozen=True, auto_attribs=True)
+class FeatureTensor(object):
+    """A dense tensor of bytes stored flat in row-major order.
+
+    `data` supports the buffer protocol, so `numpy.frombuffer(tensor.data, numpy.uint8).reshape(tensor.shape)`
+    gives a view on it without copying."""
+    data: array
+    shape: Tuple[int, ...]
+
+    @property
+    def stride(self) -> int:
+        """Amount of elements for each step along the first axis."""
+        result = 1
+        for dimension in self.shape[1:]:
+            result *= dimension
+        return result
+
+
+def chart_features(chart: Union[PureChart, UntimedNotefield],
+                   axis: str = 'time',
+                   bin_size: float = 0.01,
+                   objects: Sequence[NoteObject] = FEATURE_OBJECTS) -> FeatureTensor:
+    """A one-hot tensor shaped (bins, lanes, objects) of where each object of a chart is.
+
+    With the `time` axis, bins are `bin_size` seconds long and start at time 0, which requires a timed chart.
+    With the `beat` axis, bins are `bin_size` beats long and start at measure 0, so charts are normalized against BPM.
+    Rows before the start are left out. Hold and roll bodies are filled in if they're among `objects`."""
+    note_field = chart.note_field if isinstance(chart, PureChart) else chart
+    if axis == 'time' and not isinstance(note_field, TimedNotefield):
+        raise ValueError('The time axis requires a timed chart')
+    if axis not in ('time', 'beat'):
+        raise ValueError('Unknown axis {}'.format(axis))
+
+    if not note_field:
+        return FeatureTensor(array('B'), (0, 0, len(objects)))
+
+    if LONG_NOTE_BODY_SET & {*objects}:
+        note_field = note_field.hold_roll_bodies_distinct
+
+    channels = {
+        obj: channel
+        for channel, obj in enumerate(objects)
+    }
+    lanes = len(note_field[0].row)
+
+    if axis == 'time':
+        coordinates = [float(row.time) / bin_size for row in note_field]
+    else:
+        coordinates = [float(row.pos) * 4 / bin_size for row in note_field]
+
+    bins = max(floor(coordinates[-1]) + 1, 0)
+    stride = lanes * len(channels)
+    data = array('B', bytes(bins * stride))
+    for coordinate, row in zip(coordinates, note_field):
+        if coordinate < 0:
+            continue
+
+        offset = floor(coordinate) * stride
+        for lane, obj in enumerate(row.row):
+            channel = channels.get(obj)
+            if channel is not None:
+                data[offset + lane * len(channels) + channel] = 1
+
+    return FeatureTensor(data, (bins, lanes, len(channels)))
+
+
+def windows(tensor: FeatureTensor, length: int, hop: Optional[int] = None, pad: bool = True) -> Iterator[FeatureTensor]:
+    """Split a tensor along its first axis into windows `length` long, a new one starting every `hop`.
+
+    By default windows are adjacent. The last window is padded with zeros, or left out if `pad` isn't set."""
+    hop = hop or length
+    stride = tensor.stride
+    total = tensor.shape[0]
+
+    for start in range(0, total, hop):
+        stop = start + length
+        if stop > total and not pad:
+            break
+
+        data = tensor.data[start * stride:min(stop, total) * stride]
+        if stop > total:
+            data.frombytes(bytes((stop - total) * stride))
+        yield FeatureTensor(data, (length, *tensor.shape[1:]))
+
+        if stop >= total:
+            break
+
+
+def batches(tensors: Iterable[FeatureTensor], batch_size: int, drop_last: bool = False) -> Iterator[FeatureTensor]:
+    """Stack tensors of the same shape into batches, along a new first axis."""
+    tensors = iter(tensors)
+    while True:
+        batch = list(islice(tensors, batch_size))
+        if not batch or (drop_last and len(batch) < batch_size):
+            return
+
+        data = array('B')
+        for tensor in batch:
+            data.extend(tensor.data)
+        yield FeatureTensor(data, (len(batch), *batch[0].shape))
+
+
+def file_windows(file: str,
+                 length: int,
+                 hop: Optional[int] = None,
+                 lanes: int = 4,
+                 axis: str = 'time',
+                 bin_size: float = 0.01,
+                 objects: Sequence[NoteObject] = FEATURE_OBJECTS) -> List[FeatureTensor]:
+    """Every window of every chart with `lanes` lanes in a simfile.
+
+    With the `time` axis, charts left untimed, such as by a BPM of zero, are skipped."""
+    return [
+        window
+        for chart in parse(file).charts
+        if chart.note_field and len(chart.note_field[0].row) == lanes
+        if axis != 'time' or isinstance(chart.note_field, TimedNotefield)
+        for window in windows(chart_features(chart, axis, bin_size, objects), length, hop)
+    ]
+
+
+def feature_batches(files: Iterable[str],
+                    batch_size: int,
+                    length: int,
+                    hop: Optional[int] = None,
+                    lanes: int = 4,
+                    axis: str = 'time',
+                    bin_size: float = 0.01,
+                    objects: Sequence[NoteObject] = FEATURE_OBJECTS,
+                    processes: Optional[int] = None,
+                    prefetch: int = 8,
+                    on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[FeatureTensor]:
+    """Batches shaped (batch_size, length, lanes, objects) of windows of charts from simfiles.
+
+    Files are parsed and turned into windows by a pool of `processes` worker processes,
+    with up to `prefetch` files in flight ahead of the consumer. Batches come in the order of `files`.
+    Files that fail to parse are skipped, after being reported to `on_error` along with the error if it's given."""
+    options = length, hop, lanes, axis, bin_size, tuple(objects)
+
+    def file_results(executor: ProcessPoolExecutor) -> Iterator[FeatureTensor]:
+        files_iterator = iter(files)
+        pending = deque(
+            (file, executor.submit(file_windows, file, *options))
+            for file in islice(files_iterator, prefetch)
+        )
+        while pending:
+            file, future = pending.popleft()
+            for next_file in islice(files_iterator, 1):
+                pending.append((next_file, executor.submit(file_windows, next_file, *options)))
+
+            try:
+                result = future.result()
+            except Exception as error:
+                if on_error is not None:
+                    on_error(file, error)
+                continue
+            yield from result
+
+    with ProcessPoolExecutor(processes) as executor:
+        yield from batches(file_results(executor), batch_size)
@@ -0,0 +1,93 @@
+"""Re-parsing of simfiles that reuses every part that didn't change since the previous parse."""
+from hashlib import blake2b
+from os import path
+from typing import Dict, Hashable, TextIO, Union
+
+from .simfile_parser import PureChart, Simfile, _read_simfile, block_tag, parse_block, split_blocks
+
+TIMING_TAGS = frozenset({'#BPMS', '#STOPS', '#FREEZES', '#OFFSET'})
+
+
+def _digest(block: str) -> bytes:
+    return blake2b(block.encode('utf-8', errors='ignore'), digest_size=16).digest()
+
+
+class IncrementalParser(object):
+    """A parser that remembers the tags of every file it parsed, keyed by their hash.
+
+    When a file is parsed again, tags with an unchanged hash are not parsed again,
+    and charts whose `#NOTES` and timing tags are unchanged are reused, timing included.
+    Charts whose timing tags changed are timed again without being parsed again.
+    Every simfile gets charts and notefields of its own, so editing the timing of one doesn't affect the others."""
+
+    def __init__(self):
+        self._states: Dict[str, Dict[Hashable, object]] = {}
+        self.parsed_blocks = 0
+        self.reused_blocks = 0
+
+    def parse(self, file: Union[str, TextIO]) -> Simfile:
+        simfile, file = _read_simfile(file)
+        file_key = path.abspath(file)
+
+        previous_state = self._states.get(file_key, {})
+        state = {}
+
+        blocks = [
+            (block_tag(block), _digest(block), block)
+            for block in split_blocks(simfile)
+        ]
+        timing_key = tuple(
+            digest
+            for tag, digest, _ in blocks
+            if tag in TIMING_TAGS
+        )
+
+        header_tokens = []
+        chart_blocks = []
+        for tag, digest, block in blocks:
+            if tag == '#NOTES':
+                chart_blocks.append((digest, block))
+            else:
+                header_tokens.append(self._reuse_or_parse(previous_state, state, digest, block))
+
+        result = Simfile.from_tokens(header_tokens)
+        result._file_context = path.dirname(file_key)
+
+        for digest, block in chart_blocks:
+            key = digest, timing_key
+            if not result.is_timeable:
+                chart = self._reuse_or_parse(previous_state, state, digest, block)
+                result.charts.append(chart)
+                continue
+            if key in previous_state:
+                # Rows are immutable, so the timed rows of the first parse can go into a new notefield
+                pure_chart: PureChart = previous_state[digest]
+                chart = pure_chart.evolve(result, previous_state[key])
+                self.reused_blocks += 1
+                state[digest] = pure_chart
+            else:
+                # An unchanged chart under changed timing only needs to be timed again
+                chart = self._reuse_or_parse(previous_state, state, digest, block).evolve(result)
+
+            state[key] = tuple(chart.note_field)
+            result.charts.append(chart)
+
+        self._states[file_key] = state
+        return result
+
+    def _reuse_or_parse(self, previous_state, state, digest: bytes, block: str):
+        if digest in previous_state:
+            self.reused_blocks += 1
+            token = previous_state[digest]
+        else:
+            self.parsed_blocks += 1
+            token = parse_block(block)
+            if isinstance(token, PureChart):
+                token.source_digest = digest
+
+        state[digest] = token
+        return token
+
+    def forget(self, file: str):
+        """Drop everything remembered about a file, such as when it's deleted."""
+        self._states.pop(path.abspath(file), None)
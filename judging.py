@@ -0,0 +1,203 @@
+"""Scoring of player inputs against timed charts."""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from enum import Enum, unique
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from attr import attrs
+
+from .basic_types import NoteObject
+from .chart_analysis import TimedNotefield
+from .rows import JUDGE_IMPORTANT_SET
+
+
+@unique
+class Judgment(Enum):
+    """Possible outcomes of judging a note, ordered from best to worst for taps."""
+    MARVELOUS = 'Marvelous'
+    PERFECT = 'Perfect'
+    GREAT = 'Great'
+    GOOD = 'Good'
+    BOO = 'Boo'
+    MISS = 'Miss'
+
+    HOLD_OK = 'OK'
+    HOLD_NG = 'NG'
+
+    MINE_HIT = 'Mine hit'
+    MINE_AVOIDED = 'Mine avoided'
+
+
+DEFAULT_WINDOWS = (
+    (Judgment.MARVELOUS, 0.0225),
+    (Judgment.PERFECT, 0.045),
+    (Judgment.GREAT, 0.090),
+    (Judgment.GOOD, 0.135),
+    (Judgment.BOO, 0.180),
+)
+MINE_WINDOW = 0.090
+HOLD_REGRAB_WINDOW = 0.250
+ROLL_TAP_WINDOW = 0.500
+
+# (time, lane, is_press), in seconds
+InputEvent = Tuple[float, int, bool]
+
+
+@attrs(frozen=True, auto_attribs=True)
+class JudgeResult(object):
+    """Judgment counts of a replay, along with the offset of every note in `JudgeChart.notes` order.
+
+    Offsets are positive for late hits and NaN for missed notes."""
+    counts: Counter
+    offsets: array
+
+
+@attrs(frozen=True, auto_attribs=True)
+class _LongNote(object):
+    note_index: int
+    start: float
+    end: float
+    is_roll: bool
+
+
+class JudgeChart(object):
+    """A timed notefield prepared for judging many replays against it.
+
+    Times are converted to floats once and split by lane into sorted arrays,
+    so matching inputs to notes is a bisection per input instead of a scan."""
+
+    def __init__(self,
+                 note_field: TimedNotefield,
+                 windows: Sequence[Tuple[Judgment, float]] = DEFAULT_WINDOWS,
+                 mine_window: float = MINE_WINDOW,
+                 hold_regrab_window: float = HOLD_REGRAB_WINDOW,
+                 roll_tap_window: float = ROLL_TAP_WINDOW):
+        self.windows = tuple(windows)
+        self._window_limits = [limit for _, limit in self.windows]
+        self.mine_window = mine_window
+        self.hold_regrab_window = hold_regrab_window
+        self.roll_tap_window = roll_tap_window
+
+        self.lanes = note_field and len(note_field[0].row) or 0
+        self.notes: List[Tuple[int, int]] = []
+        self._note_times = [array('d') for _ in range(self.lanes)]
+        self._note_indices = [array('l') for _ in range(self.lanes)]
+        # Lifts are hit by releasing, so they're matched against releases instead of presses
+        self._lift_times = [array('d') for _ in range(self.lanes)]
+        self._lift_indices = [array('l') for _ in range(self.lanes)]
+        self._mine_times = [array('d') for _ in range(self.lanes)]
+        self._long_notes: List[List[_LongNote]] = [[] for _ in range(self.lanes)]
+
+        open_long_notes = {}
+        for row_index, row in enumerate(note_field):
+            time = float(row.time)
+            for lane, obj in enumerate(row.row):
+                if obj is NoteObject.LIFT:
+                    self._lift_times[lane].append(time)
+                    self._lift_indices[lane].append(len(self.notes))
+                    self.notes.append((row_index, lane))
+                elif obj in JUDGE_IMPORTANT_SET:
+                    self._note_times[lane].append(time)
+                    self._note_indices[lane].append(len(self.notes))
+                    if obj in (NoteObject.HOLD_START, NoteObject.ROLL_START):
+                        open_long_notes[lane] = len(self.notes), time, obj is NoteObject.ROLL_START
+                    self.notes.append((row_index, lane))
+                elif obj is NoteObject.MINE:
+                    self._mine_times[lane].append(time)
+                elif obj is NoteObject.HOLD_ROLL_END and lane in open_long_notes:
+                    note_index, start, is_roll = open_long_notes.pop(lane)
+                    self._long_notes[lane].append(_LongNote(note_index, start, time, is_roll))
+
+    def _judgment_of(self, offset: float) -> Judgment:
+        return self.windows[bisect_left(self._window_limits, abs(offset))][0]
+
+    def judge(self, events: Iterable[InputEvent]) -> JudgeResult:
+        """Judge a replay, given as (time, lane, is_press) events in any order.
+
+        Each press hits the earliest unhit note of its lane within the widest timing window,
+        and each release the earliest unhit lift.
+        Holds need their head hit and no release longer than the regrab window before their end,
+        rolls need their head hit and no gap between presses longer than the roll tap window.
+        A mine is hit by pressing within the mine window of it, or by holding its lane through it."""
+        presses = [[] for _ in range(self.lanes)]
+        releases = [[] for _ in range(self.lanes)]
+        for time, lane, is_press in events:
+            (presses if is_press else releases)[lane].append(time)
+
+        offsets = array('d', [float('nan')]) * len(self.notes)
+        counts = Counter()
+
+        for lane in range(self.lanes):
+            lane_presses = presses[lane]
+            lane_releases = releases[lane]
+            lane_presses.sort()
+            lane_releases.sort()
+
+            self._match(lane_presses, self._note_times[lane], self._note_indices[lane], offsets, counts)
+            self._match(lane_releases, self._lift_times[lane], self._lift_indices[lane], offsets, counts)
+
+            for long_note in self._long_notes[lane]:
+                counts[self._judge_long_note(long_note, offsets, lane_presses, lane_releases)] += 1
+
+            for mine in self._mine_times[lane]:
+                counts[self._judge_mine(mine, lane_presses, lane_releases)] += 1
+
+        misses = sum(offset != offset for offset in offsets)
+        if misses:
+            counts[Judgment.MISS] = misses
+        return JudgeResult(counts, offsets)
+
+    def _match(self, inputs: List[float], note_times: array, note_indices: array, offsets: array, counts: Counter):
+        """Hit the earliest unhit note within the widest timing window of each of the sorted `inputs`."""
+        widest_window = self._window_limits[-1]
+        next_note = 0
+        for time in inputs:
+            next_note = bisect_left(note_times, time - widest_window, next_note)
+            if next_note == len(note_times):
+                break
+            if note_times[next_note] <= time + widest_window:
+                offset = time - note_times[next_note]
+                offsets[note_indices[next_note]] = offset
+                counts[self._judgment_of(offset)] += 1
+                next_note += 1
+
+    def _judge_long_note(self, long_note: _LongNote, offsets: array, presses: List[float], releases: List[float]):
+        head_offset = offsets[long_note.note_index]
+        if head_offset != head_offset:
+            return Judgment.HOLD_NG
+
+        grabbed_at = long_note.start + head_offset
+        if long_note.is_roll:
+            first = bisect_right(presses, grabbed_at)
+            last = bisect_left(presses, long_note.end, first)
+            taps = [grabbed_at, *presses[first:last], long_note.end]
+            longest_gap = max(later - earlier for earlier, later in zip(taps, taps[1:]))
+            return Judgment.HOLD_OK if longest_gap <= self.roll_tap_window else Judgment.HOLD_NG
+
+        first = bisect_right(releases, grabbed_at)
+        last = bisect_left(releases, long_note.end, first)
+        for release in releases[first:last]:
+            regrab = bisect_right(presses, release)
+            regrabbed_at = min(presses[regrab], long_note.end) if regrab < len(presses) else long_note.end
+            if regrabbed_at - release > self.hold_regrab_window:
+                return Judgment.HOLD_NG
+        return Judgment.HOLD_OK
+
+    def _judge_mine(self, mine: float, presses: List[float], releases: List[float]) -> Judgment:
+        nearby = bisect_left(presses, mine - self.mine_window)
+        if nearby < len(presses) and presses[nearby] <= mine + self.mine_window:
+            return Judgment.MINE_HIT
+
+        last_press = bisect_right(presses, mine) - 1
+        if last_press >= 0:
+            # A lane never released after its last press is held until the end of the replay
+            release = bisect_right(releases, presses[last_press])
+            if release == len(releases) or releases[release] > mine:
+                return Judgment.MINE_HIT
+        return Judgment.MINE_AVOIDED
+
+    def judge_many(self, replays: Iterable[Iterable[InputEvent]]) -> Iterator[JudgeResult]:
+        """Judge replays one after another, reusing the prepared chart."""
+        for replay in replays:
+            yield self.judge(replay)
@@ -0,0 +1,167 @@
+"""Detection of multi-row patterns, such as streams and jacks, in classified notefields."""
+from enum import Enum, unique
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from attr import attrs
+
+from .basic_types import NoteObject, Time
+from .chart_analysis import MetaNotefield
+from .rows import RowFlags
+
+NOTE_FLAGS = ~RowFlags.RELEASE
+NOTE_OBJECTS = frozenset({NoteObject.TAP_OBJECT, NoteObject.HOLD_START, NoteObject.ROLL_START})
+
+LEFT, DOWN, UP, RIGHT = range(4)
+LEFT_FOOT, RIGHT_FOOT = 0, 1
+
+
+@unique
+class Pattern(Enum):
+    STREAM = 'stream'
+    JUMPSTREAM = 'jumpstream'
+    HANDSTREAM = 'handstream'
+    MINIJACK = 'minijack'
+    JACK = 'jack'
+    CANDLE = 'candle'
+    CROSSOVER = 'crossover'
+
+
+@attrs(frozen=True, auto_attribs=True)
+class PatternSpan(object):
+    """A pattern spanning rows `start` to `stop` (exclusive) of a notefield, along with their times."""
+    pattern: Pattern
+    start: int
+    stop: int
+    start_time: Optional[Time]
+    end_time: Optional[Time]
+
+
+class _PatternCollector(object):
+    def __init__(self, meta_field: MetaNotefield):
+        self.meta_field = meta_field
+        self.spans: List[PatternSpan] = []
+
+    def add(self, pattern: Pattern, start: int, end: int):
+        start_row = self.meta_field[start].row
+        end_row = self.meta_field[end].row
+        self.spans.append(PatternSpan(pattern, start, end + 1,
+                                      getattr(start_row, 'time', None), getattr(end_row, 'time', None)))
+
+
+def detect_patterns(meta_field: MetaNotefield,
+                    min_stream_length: int = 8,
+                    max_stream_gap: Fraction = Fraction(1, 8),
+                    max_jack_gap: Fraction = Fraction(1, 4)) -> List[PatternSpan]:
+    """Find patterns in a classified notefield in a single pass over its rows.
+
+    A stream is at least `min_stream_length` note rows evenly spaced at most `max_stream_gap` measures apart,
+    it's a jumpstream if it has jumps and a handstream if it has hands or quads.
+    Jacks are notes on the same lane in consecutive note rows at most `max_jack_gap` measures apart,
+    two of them make a minijack.
+
+    Candles and crossovers are only looked for in 4-lane charts, within runs of single notes,
+    assuming feet alternate except on jacks and the first note is taken with the foot on its side, left if neither.
+    Spans are ordered by where they end."""
+    collector = _PatternCollector(meta_field)
+
+    stream_start = stream_gap = None
+    stream_rows = 0
+    stream_width = 0
+
+    jack_starts: Dict[int, int] = {}
+    jack_lengths: Dict[int, int] = {}
+
+    feet: Dict[int, Tuple[int, int]] = {}
+    last_single: Optional[Tuple[int, int, int]] = None
+
+    previous_index = previous_pos = None
+    previous_width = 0
+
+    def close_stream(end):
+        if stream_rows >= min_stream_length:
+            if stream_width >= 3:
+                pattern = Pattern.HANDSTREAM
+            elif stream_width == 2:
+                pattern = Pattern.JUMPSTREAM
+            else:
+                pattern = Pattern.STREAM
+            collector.add(pattern, stream_start, end)
+
+    def close_jack(lane, end):
+        length = jack_lengths.pop(lane)
+        start = jack_starts.pop(lane)
+        if length >= 3:
+            collector.add(Pattern.JACK, start, end)
+        elif length == 2:
+            collector.add(Pattern.MINIJACK, start, end)
+
+    for index, meta_row in enumerate(meta_field):
+        if not meta_row.kind & NOTE_FLAGS:
+            continue
+
+        row = meta_row.row
+        lanes = frozenset(
+            lane
+            for lane, obj in enumerate(row.row)
+            if obj in NOTE_OBJECTS
+        )
+        width = len(lanes)
+        gap = row.pos - previous_pos if previous_pos is not None else None
+
+        # Streams, runs of evenly spaced note rows
+        if previous_index is not None and gap <= max_stream_gap and (stream_gap is None or gap == stream_gap):
+            stream_gap = gap
+            stream_rows += 1
+            stream_width = max(stream_width, width)
+        else:
+            if previous_index is not None:
+                close_stream(previous_index)
+            if previous_index is not None and gap <= max_stream_gap:
+                stream_start, stream_gap, stream_rows = previous_index, gap, 2
+                stream_width = max(previous_width, width)
+            else:
+                stream_start, stream_gap, stream_rows, stream_width = index, None, 1, width
+
+        # Jacks, the same lane in consecutive note rows
+        for lane in [*jack_lengths]:
+            if lane not in lanes or gap > max_jack_gap:
+                close_jack(lane, previous_index)
+        for lane in lanes:
+            if lane in jack_lengths:
+                jack_lengths[lane] += 1
+            else:
+                jack_starts[lane], jack_lengths[lane] = index, 1
+
+        # Candles and crossovers, from which foot takes each single note
+        if width == 1 and len(row.row) == 4:
+            lane, = lanes
+            if last_single is None:
+                foot = RIGHT_FOOT if lane == RIGHT else LEFT_FOOT
+            elif lane == last_single[1]:
+                foot = last_single[2]
+            else:
+                foot = 1 - last_single[2]
+
+            if (foot, lane) in ((LEFT_FOOT, RIGHT), (RIGHT_FOOT, LEFT)):
+                collector.add(Pattern.CROSSOVER, last_single[0] if last_single else index, index)
+
+            if foot in feet:
+                foot_index, foot_lane = feet[foot]
+                if {foot_lane, lane} == {DOWN, UP}:
+                    collector.add(Pattern.CANDLE, foot_index, index)
+
+            feet[foot] = index, lane
+            last_single = index, lane, foot
+        else:
+            feet.clear()
+            last_single = None
+
+        previous_index, previous_pos, previous_width = index, row.pos, width
+
+    if previous_index is not None:
+        close_stream(previous_index)
+        for lane in [*jack_lengths]:
+            close_jack(lane, previous_index)
+
+    return collector.spans
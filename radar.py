@@ -0,0 +1,96 @@
+"""Groove radar values of charts, computed with StepMania's classic formulas."""
+from array import array
+from typing import Iterable, List, Optional
+
+from attr import attrs
+
+from .basic_types import NoteObject
+from .chart_analysis import BatchOperations, ChartArrays
+from .rows import JUDGE_IMPORTANT_SET, OBJECT_CODES, lane_codes
+from .simfile_parser import AugmentedChart
+
+# Voltage is the peak density over windows this many beats long
+BEAT_WINDOW = 8
+
+_NOTE_CODES = frozenset(OBJECT_CODES[obj] for obj in JUDGE_IMPORTANT_SET)
+_LONG_NOTE_CODES = frozenset({OBJECT_CODES[NoteObject.HOLD_START], OBJECT_CODES[NoteObject.ROLL_START]})
+
+
+@attrs(frozen=True, auto_attribs=True)
+class RadarValues(object):
+    """Radar values, each between 0 and 1, in the order SM files list them."""
+    stream: float = 0.0
+    voltage: float = 0.0
+    air: float = 0.0
+    freeze: float = 0.0
+    chaos: float = 0.0
+
+
+def radar_from_arrays(chart: ChartArrays) -> RadarValues:
+    """Radar values of a timed notefield, in a single pass over its rows.
+
+    The length of the song is taken as the time of the last note, with notes being taps, lifts and long note heads.
+    Stream is the average amount of notes per second over 7, voltage the peak amount of notes per beat
+    over windows of 8 beats times the average beats per second over 10,
+    air the amount of jumps per second, freeze the amount of holds and rolls per second,
+    and chaos half the amount of notes finer than 8ths per second."""
+    notes = jumps = long_notes = chaos_notes = 0
+    window = window_notes = peak_window_notes = 0
+    last_time = last_beat = 0.0
+
+    for code, numerator, denominator, time in zip(chart.codes, chart.numerators, chart.denominators, chart.times):
+        row_notes = row_long_notes = 0
+        for lane_code in lane_codes(code, chart.lanes):
+            if lane_code in _NOTE_CODES:
+                row_notes += 1
+                if lane_code in _LONG_NOTE_CODES:
+                    row_long_notes += 1
+        if not row_notes:
+            continue
+
+        notes += row_notes
+        long_notes += row_long_notes
+        if row_notes >= 2:
+            jumps += 1
+        if 8 % denominator:
+            chaos_notes += row_notes
+
+        row_window = numerator * 4 // (denominator * BEAT_WINDOW)
+        if row_window != window:
+            peak_window_notes = max(peak_window_notes, window_notes)
+            window, window_notes = row_window, 0
+        window_notes += row_notes
+
+        last_time = time
+        last_beat = numerator * 4 / denominator
+
+    peak_window_notes = max(peak_window_notes, window_notes)
+    seconds = last_time
+    if not notes or not seconds > 0:
+        return RadarValues()
+
+    return RadarValues(
+        stream=min(notes / seconds / 7, 1.0),
+        voltage=min(peak_window_notes / BEAT_WINDOW * (last_beat / seconds) / 10, 1.0),
+        air=min(jumps / seconds, 1.0),
+        freeze=min(long_notes / seconds, 1.0),
+        chaos=min(chaos_notes / seconds * 0.5, 1.0),
+    )
+
+
+def chart_radar(chart: AugmentedChart) -> RadarValues:
+    """Radar values of a chart, see `radar_from_arrays`."""
+    note_field = chart.note_field
+    return radar_from_arrays(ChartArrays(
+        note_field.lanes,
+        array('q', (row.code for row in note_field)),
+        array('q', (row.pos.numerator for row in note_field)),
+        array('q', (row.pos.denominator for row in note_field)),
+        array('d', (float(row.time) for row in note_field)),
+    ))
+
+
+def library_radars(charts: Iterable[AugmentedChart], processes: Optional[int] = None) -> List[RadarValues]:
+    """Radar values of many charts, computed in a pool of worker processes, in the order of `charts`."""
+    with BatchOperations(chart.note_field for chart in charts) as batch:
+        return batch.map(radar_from_arrays, processes)
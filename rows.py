@@ -1,12 +1,12 @@
 from enum import IntFlag, unique
 from functools import lru_cache
 from itertools import permutations, product
-from typing import Container, Optional, Union
+from typing import Container, Optional, Tuple, Union
 
-from attr import attrs, evolve
+from attr import attrib, attrs
 
-from .basic_types import DeltaInvariant, GlobalPosition, LocalPosition, Measure, NoteObject, PositionInvariant, Time, \
-    TimeInvariant, make_ordered_set
+from .basic_types import DeltaInvariant, GlobalPosition, LocalPosition, Measure, NoteObject, PositionInvariant, \
+    Snap as SnapColor, Time, TimeInvariant, make_ordered_set
 
 FULL_SET = {*NoteObject.__members__.values()}
 
@@ -19,16 +19,83 @@ JUDGE_NON_IMPORTANT_SET = DECORATIVE_SET | LONG_NOTE_BODY_SET | {NoteObject.HOLD
 JUDGE_IMPORTANT_SET = FULL_SET - JUDGE_NON_IMPORTANT_SET
 NON_DECORATIVE_SET = FULL_SET - DECORATIVE_SET
 
+# Objects as packed in row codes, 4 bits per lane
+CODE_BITS = 4
+CODE_OBJECTS = tuple(NoteObject)
+OBJECT_CODES = {
+    obj: code
+    for code, obj in enumerate(CODE_OBJECTS)
+}
+_JUDGED_CODES = frozenset(OBJECT_CODES[obj] for obj in JUDGE_IMPORTANT_SET)
+TICKS_PER_MEASURE = 192
+
+
+def pack_code_key(code: int, lanes: int, position: Optional[Union[GlobalPosition, LocalPosition]] = None) -> Optional[int]:
+    """The integer key of `pack_row_key` from a row code, None if it doesn't fit one."""
+    if lanes >> CODE_BITS:
+        return None
+
+    key = code << CODE_BITS | lanes
+    if position is None:
+        return key
+
+    ticks, remainder = divmod(position.numerator * TICKS_PER_MEASURE, position.denominator)
+    if remainder:
+        return None
+    return ticks << (lanes + 1) * CODE_BITS | key
+
+
+def pack_row_key(row: Optional['PureRow'], position: Optional[Union[GlobalPosition, LocalPosition]] = None):
+    """A key identifying a row at a position, an integer packing the tick of the position at 192 ticks per measure,
+    the row code and the amount of lanes, from highest to lowest bits.
+
+    Rows off the 192 grid, with 16 lanes or more, or missing a row fall back to a tuple."""
+    key = None if row is None else pack_code_key(row.code, len(row), position)
+    return (row, position) if key is None else key
+
+
+@lru_cache(4096)
+def lane_codes(code: int, lanes: int) -> Tuple[int, ...]:
+    """The object code of each lane of a row code, see `PureRow.code`."""
+    mask = (1 << CODE_BITS) - 1
+    return tuple(code >> lane * CODE_BITS & mask for lane in range(lanes))
+
+
+@lru_cache(4096)
+def judged_note_count(code: int, lanes: int) -> int:
+    """How many objects of a row code are judged, see `JUDGE_IMPORTANT_SET`."""
+    return sum(lane_code in _JUDGED_CODES for lane_code in lane_codes(code, lanes))
+
 
-@attrs(frozen=True, auto_attribs=True)
 class HasRow(object):
-    _row: Optional['PureRow'] = None
+    """Mixin for objects with a row, the `_row` and `_key` slots are declared by the classes using it.
 
-    @staticmethod
-    def _typed_evolve(target, **kwargs):
-        if isinstance(target, PureRow):
-            return kwargs['row']
-        return evolve(target, **kwargs)
+    Equality and hashing go through `key`, computed on first use, then attributes in `_compared_besides_key`."""
+    __slots__ = ()
+    _compared_besides_key = ()
+
+    @property
+    def key(self):
+        key = self._key
+        if key is None:
+            key = pack_row_key(self._row, getattr(self, '_pos', None))
+            object.__setattr__(self, '_key', key)
+        return key
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.key == other.key and all(
+            getattr(self, name) == getattr(other, name)
+            for name in self._compared_besides_key
+        )
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def with_row(self, row: 'PureRow'):
+        """A copy with another row, everything else kept."""
+        return NotImplemented
 
     @property
     def row(self):
@@ -36,7 +103,7 @@ class HasRow(object):
 
     @property
     def row_invariant(self):
-        return self._typed_evolve(self, row=RowInvariant)
+        return self.with_row(RowInvariant)
 
     @property
     def is_empty(self) -> bool:
@@ -56,12 +123,16 @@ class HasRow(object):
 
     @property
     def mirror(self):
-        return self._typed_evolve(self, row=self.row.mirror)
+        return self.with_row(self.row.mirror)
+
+    @property
+    def code(self) -> int:
+        return self.row.code
 
     @property
     def permutative_group(self):
         return make_ordered_set(
-            self._typed_evolve(self, row=PureRow(group))
+            self.with_row(PureRow(group))
             for group in permutations(self.row)
         )
 
@@ -71,7 +142,7 @@ class HasRow(object):
         return frozenset(self.permutative_group)
 
     def switch_lanes(self, lane_map):
-        return self._typed_evolve(self, row=PureRow(
+        return self.with_row(PureRow(
             self.row[lane_map.get(lane, lane)]
             for lane, _ in enumerate(self.row)
         ))
@@ -91,12 +162,16 @@ class HasRow(object):
             obj in from_note and to_note or obj
             for obj in self.row
         )
-        return self._typed_evolve(self, row=new_row)
+        return self.with_row(new_row)
 
 
-@attrs(frozen=True, auto_attribs=True)
 class HasTime(object):
-    _time: Optional[Time] = None
+    """Mixin for objects with a time, the `_time` slot is declared by the classes using it."""
+    __slots__ = ()
+
+    def with_time(self, time: Time):
+        """A copy with another time, everything else kept."""
+        return NotImplemented
 
     @property
     def time(self):
@@ -104,16 +179,20 @@ class HasTime(object):
 
     @property
     def time_invariant(self):
-        return evolve(self, time=TimeInvariant)
+        return self.with_time(TimeInvariant)
 
     @classmethod
     def from_two_rows(cls, from_: 'HasTime', to: 'HasTime'):
         return cls(time=to.time - from_.time)
 
 
-@attrs(frozen=True, auto_attribs=True)
 class HasPosition(object):
-    _pos: Optional[Union[GlobalPosition, LocalPosition]] = None
+    """Mixin for objects with a position, the `_pos` slot is declared by the classes using it."""
+    __slots__ = ()
+
+    def with_position(self, position: Union[GlobalPosition, LocalPosition]):
+        """A copy with another position, everything else kept."""
+        return NotImplemented
 
     @property
     def snap(self):
@@ -129,15 +208,19 @@ class HasPosition(object):
 
     @property
     def position_invariant(self):
-        return evolve(self, pos=PositionInvariant)
+        return self.with_position(PositionInvariant)
 
     def localize(self, window_factor=1):
-        return evolve(self, pos=LocalPosition(self.pos % window_factor / window_factor))
+        return self.with_position(LocalPosition(self.pos % window_factor / window_factor))
 
 
-@attrs(frozen=True, auto_attribs=True)
 class HasDelta(object):
-    _delta: Optional[Time] = None
+    """Mixin for objects with a delta, the `_delta` slot is declared by the classes using it."""
+    __slots__ = ()
+
+    def with_delta(self, delta: Time):
+        """A copy with another delta, everything else kept."""
+        return NotImplemented
 
     @property
     def delta(self):
@@ -145,16 +228,19 @@ class HasDelta(object):
 
     @property
     def delta_invariant(self):
-        return evolve(self, delta=DeltaInvariant)
+        return self.with_delta(DeltaInvariant)
 
 
 class HasEvolution(object):
+    __slots__ = ()
+
     def evolve(self, *args):
         return NotImplemented
 
 
 class PureRow(tuple, HasRow, HasEvolution):
     """A basic class representing a row, equivalent to tuples with additional methods."""
+    __slots__ = ()
 
     @classmethod
     def from_str_row(cls, row: str) -> 'PureRow':
@@ -163,6 +249,22 @@ class PureRow(tuple, HasRow, HasEvolution):
             for char in row
         )
 
+    @classmethod
+    def from_code(cls, code: int, lanes: int) -> 'PureRow':
+        return PureRow(CODE_OBJECTS[lane_code] for lane_code in lane_codes(code, lanes))
+
+    @property
+    def key(self):
+        return pack_row_key(self)
+
+    @property
+    def code(self) -> int:
+        """The row packed into an integer, 4 bits per lane with the first lane lowest, fits 64 bits up to 15 lanes."""
+        result = 0
+        for lane, obj in enumerate(self):
+            result |= OBJECT_CODES[obj] << lane * CODE_BITS
+        return result
+
     @property
     def str_row(self) -> str:
         return ''.join(
@@ -182,6 +284,9 @@ class PureRow(tuple, HasRow, HasEvolution):
     def row(self):
         return self
 
+    def with_row(self, row: 'PureRow') -> 'PureRow':
+        return row
+
     @property
     def mirror(self) -> 'PureRow':
         return PureRow(self[::-1])
@@ -193,46 +298,80 @@ class PureRow(tuple, HasRow, HasEvolution):
 RowInvariant = PureRow([])
 
 
-@attrs(frozen=True, auto_attribs=True)
+@attrs(frozen=True, auto_attribs=True, slots=True, eq=False)
 class LocalRow(HasRow, HasPosition, HasEvolution):
     """A basic object representing a row within a measure."""
     _row: Optional[PureRow] = None
     _pos: Optional[LocalPosition] = None
+    _key: object = attrib(default=None, init=False, repr=False)
+
+    def with_row(self, row: PureRow) -> 'LocalRow':
+        return LocalRow(row, self._pos)
+
+    def with_position(self, position: LocalPosition) -> 'LocalRow':
+        return LocalRow(self._row, position)
 
     def evolve(self, global_measure: Measure) -> 'GlobalRow':
         return GlobalRow(self.row, GlobalPosition(self.pos + global_measure))
 
 
+@attrs(frozen=True, auto_attribs=True, slots=True, eq=False)
 class TimedRow(HasRow, HasTime, HasEvolution):
     _row: Optional[PureRow] = None
     _time: Optional[Time] = None
+    _key: object = attrib(default=None, init=False, repr=False)
+    _compared_besides_key = ('_time',)
+
+    def with_row(self, row: PureRow) -> 'TimedRow':
+        return TimedRow(row, self._time)
+
+    def with_time(self, time: Time) -> 'TimedRow':
+        return TimedRow(self._row, time)
 
     def evolve(self, position: GlobalPosition) -> 'GlobalTimedRow':
         return GlobalTimedRow(self.row, position, self.time)
 
 
-@attrs(frozen=True, auto_attribs=True)
+@attrs(frozen=True, auto_attribs=True, slots=True, eq=False)
 class GlobalRow(HasRow, HasPosition, HasEvolution):
     """A basic object representing a row within a chart."""
     _row: Optional[PureRow] = None
     _pos: Optional[GlobalPosition] = None
+    _key: object = attrib(default=None, init=False, repr=False)
+
+    def with_row(self, row: PureRow) -> 'GlobalRow':
+        return GlobalRow(row, self._pos)
+
+    def with_position(self, position: GlobalPosition) -> 'GlobalRow':
+        return GlobalRow(self._row, position)
 
     def evolve(self, time: Time) -> 'GlobalTimedRow':
         return GlobalTimedRow(self.row, self.pos, time)
 
 
-@attrs(frozen=True, auto_attribs=True)
+@attrs(frozen=True, auto_attribs=True, slots=True, eq=False)
 class GlobalTimedRow(HasRow, HasPosition, HasTime, HasEvolution):
     """An augmented version of GlobalRow, with timing data attached to it."""
     _row: Optional[PureRow] = None
     _pos: Optional[GlobalPosition] = None
     _time: Optional[Time] = None
+    _key: object = attrib(default=None, init=False, repr=False)
+    _compared_besides_key = ('_time',)
+
+    def with_row(self, row: PureRow) -> 'GlobalTimedRow':
+        return GlobalTimedRow(row, self._pos, self._time)
+
+    def with_position(self, position: GlobalPosition) -> 'GlobalTimedRow':
+        return GlobalTimedRow(self._row, position, self._time)
+
+    def with_time(self, time: Time) -> 'GlobalTimedRow':
+        return GlobalTimedRow(self._row, self._pos, time)
 
     def evolve(self, next_row: HasTime) -> 'GlobalDeltaRow':
         return GlobalDeltaRow(self.row, self.pos, self.time, Time(next_row.time - self.time))
 
 
-@attrs(frozen=True, auto_attribs=True)
+@attrs(frozen=True, auto_attribs=True, slots=True, eq=False)
 class GlobalDeltaRow(HasRow, HasPosition, HasTime, HasDelta):
     """A contextually dependent version of GlobalTimedRow,
     where `delta` is the difference in time between this and next row"""
@@ -240,23 +379,26 @@ class GlobalDeltaRow(HasRow, HasPosition, HasTime, HasDelta):
     _pos: Optional[GlobalPosition] = None
     _time: Optional[Time] = None
     _delta: Optional[Time] = None
+    _key: object = attrib(default=None, init=False, repr=False)
+    _compared_besides_key = ('_time', '_delta')
+
+    def with_row(self, row: PureRow) -> 'GlobalDeltaRow':
+        return GlobalDeltaRow(row, self._pos, self._time, self._delta)
+
+    def with_position(self, position: GlobalPosition) -> 'GlobalDeltaRow':
+        return GlobalDeltaRow(self._row, position, self._time, self._delta)
+
+    def with_time(self, time: Time) -> 'GlobalDeltaRow':
+        return GlobalDeltaRow(self._row, self._pos, time, self._delta)
+
+    def with_delta(self, delta: Time) -> 'GlobalDeltaRow':
+        return GlobalDeltaRow(self._row, self._pos, self._time, delta)
 
 
 class Snap(int):
     @property
     def snap_value(self):
-        return (
-                self in (1, 2, 4) and 4 or
-                self is 3 and 12 or
-                self is 8 and 8 or
-                self is 12 and 12 or
-                self is 16 and 16 or
-                self is 24 and 24 or
-                self is 32 and 32 or
-                self is 48 and 48 or
-                self is 64 and 64 or
-                192
-        )
+        return SnapColor.from_denominator(self).value
 
     @classmethod
     def from_row(cls, row: HasPosition):
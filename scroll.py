@@ -0,0 +1,79 @@
+"""Scroll positions and visible rows for many frames at once, for rendering charts."""
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, Sequence
+
+from attr import attrs
+
+from .chart_analysis import TimedNotefield
+from .timing import TimingSegments
+
+
+@attrs(frozen=True, auto_attribs=True)
+class ScrollFrames(object):
+    """For each frame, the scroll position in measures and the rows visible, from `starts[i]` until `stops[i]`."""
+    positions: array
+    starts: array
+    stops: array
+
+
+class ScrollEvaluator(object):
+    """A snapshot of timing segments as floats, to evaluate the scroll position at many times at once.
+
+    Positions match `TimingSegments.position_at` up to float precision: the position holds during stops
+    and the first BPM is extrapolated before measure 0. Build a new evaluator after editing the timing."""
+
+    def __init__(self, timing: TimingSegments, note_field: Optional[TimedNotefield] = None):
+        knots = timing.knots()
+        offset = knots.offset
+        self._measures = array('d', map(float, knots.measures))
+        self._arrivals = array('d', (float(arrival - offset) for arrival in knots.arrivals))
+        self._moving_since = array('d', (
+            float(arrival + stop - offset)
+            for arrival, stop in zip(knots.arrivals, knots.stops)
+        ))
+        self._seconds_per_measure = array('d', map(float, knots.seconds_per_measure))
+        self._row_positions = array('d', (float(row.pos) for row in note_field or ()))
+
+    def positions(self, times: Sequence[float]) -> array:
+        """Scroll position in measures at each of `times`, in seconds.
+
+        Times in increasing order, as frames usually are, are swept through the knots instead of bisecting them."""
+        measures = self._measures
+        arrivals = self._arrivals
+        moving_since = self._moving_since
+        seconds_per_measure = self._seconds_per_measure
+        last_knot = len(arrivals) - 1
+
+        result = array('d', [0.0]) * len(times)
+        index = -1
+        previous_time = float('-inf')
+        for frame, time in enumerate(times):
+            if time < previous_time:
+                index = bisect_right(arrivals, time) - 1
+            else:
+                while index < last_knot and arrivals[index + 1] <= time:
+                    index += 1
+            previous_time = time
+
+            if index < 0:
+                result[frame] = measures[0] + (time - arrivals[0]) / seconds_per_measure[0]
+            elif time <= moving_since[index]:
+                result[frame] = measures[index]
+            else:
+                result[frame] = measures[index] + (time - moving_since[index]) / seconds_per_measure[index]
+        return result
+
+    def evaluate(self, times: Sequence[float], look_behind: float = 0.0, look_ahead: float = 1.0) -> ScrollFrames:
+        """Scroll positions at each of `times`, along with the rows from `look_behind` measures before them
+        until `look_ahead` measures after them, which requires the evaluator to have a notefield."""
+        positions = self.positions(times)
+        row_positions = self._row_positions
+
+        starts = array('q', [0]) * len(positions)
+        stops = array('q', [0]) * len(positions)
+        for frame, position in enumerate(positions):
+            start = bisect_left(row_positions, position - look_behind)
+            starts[frame] = start
+            stops[frame] = bisect_left(row_positions, position + look_ahead, start)
+        return ScrollFrames(positions, starts, stops)
@@ -1,15 +1,18 @@
-from os import chdir, getcwd, path
-from os.path import join
+from concurrent.futures import Executor
+from functools import lru_cache
+from os import path
 from re import sub
-from typing import Dict, List, Optional, TextIO, Tuple, Union
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple, Union
 
 from attr import Factory, attrs
-from lark import Lark, Transformer
 
-from .basic_types import BPM, CheaperFraction, LocalPosition, Measure, Time
+from .assets import AssetBuffer, AssetManager
+from .basic_types import BPM, CheaperFraction, GlobalPosition, LocalPosition, Measure, NoteObject, Time
 from .chart_analysis import TimedNotefield, UntimedNotefield
 from .complex_types import MeasureBPMPair, MeasureMeasurePair, MeasureValuePair
-from .rows import GlobalRow, LocalRow, PureRow
+from .rows import GlobalRow, GlobalTimedRow, PureRow
+from .timing import TimingEdit, TimingSegments
+from .validation import Diagnostic, FATAL_TIMING_KINDS, InvalidSimfileError, LongNoteTracker, validate_bpm_segments
 
 
 @attrs(cmp=False, auto_attribs=True)
@@ -19,31 +22,65 @@ class PureChart(object):
     diff_name: str = 'Beginner'
     diff_value: int = 1
     note_field: UntimedNotefield = Factory(UntimedNotefield)
+    radar_values: Optional[Tuple[CheaperFraction, ...]] = None
+    diagnostics: List[Diagnostic] = Factory(list)
+    # Digest of the `#NOTES` block the chart was parsed from, when known, such as with `IncrementalParser`
+    source_digest: Optional[bytes] = None
+
+    @property
+    def lanes(self) -> int:
+        return self.note_field.lanes
 
     @classmethod
     def from_tokens(cls, tokens):
         if len(tokens) == 4:
+            rows, diagnostics = tokens[3]
             return cls('',
                        tokens[0].children[0],
                        tokens[1].children[0],
-                       UntimedNotefield(tokens[3]))
+                       UntimedNotefield(rows),
+                       diagnostics=diagnostics)
         if len(tokens) == 5:
+            rows, diagnostics = tokens[4]
             return cls(tokens[0].children[0],
                        tokens[1].children[0],
                        tokens[2].children[0],
-                       UntimedNotefield(tokens[4]))
+                       UntimedNotefield(rows),
+                       tokens[3],
+                       diagnostics)
+
+    def check(self):
+        """Raise an `InvalidSimfileError` if any problem was found in this chart while parsing it."""
+        if self.diagnostics:
+            raise InvalidSimfileError(self.diagnostics, '{} {}'.format(self.diff_name, self.diff_value))
+
+    def fingerprint(self, mirror_invariant: bool = False, lane_invariant: bool = False) -> bytes:
+        """See `UntimedNotefield.fingerprint`, metadata such as the step artist doesn't affect it."""
+        return self.note_field.fingerprint(mirror_invariant, lane_invariant)
+
+    def evolve(self, context: 'Simfile', timed_rows: Optional[Sequence[GlobalTimedRow]] = None) -> 'AugmentedChart':
+        """This chart timed by the segments of `context`.
+
+        `timed_rows` are rows already timed by the same segments, such as ones kept by `IncrementalParser`,
+        they're copied into a new notefield instead of being timed again."""
+        if timed_rows is None:
+            note_field = self.note_field.calculate_timings(context.bpm_segments,
+                                                           context.stop_segments,
+                                                           context.offset)
+        else:
+            note_field = TimedNotefield(timed_rows)
 
-    def evolve(self, context: 'Simfile') -> 'AugmentedChart':
         return AugmentedChart(
-            self.step_artist,
-            self.diff_name,
-            self.diff_value,
-            self.note_field.calculate_timings(context.bpm_segments,
-                                              context.stop_segments,
-                                              context.offset),
-            context.bpm_segments,
-            context.stop_segments,
-            context.offset
+            step_artist=self.step_artist,
+            diff_name=self.diff_name,
+            diff_value=self.diff_value,
+            note_field=note_field,
+            bpm_segments=context.bpm_segments,
+            stop_segments=context.stop_segments,
+            offset=context.offset,
+            radar_values=self.radar_values,
+            diagnostics=list(self.diagnostics),
+            source_digest=self.source_digest
         )
 
 
@@ -57,6 +94,14 @@ class AugmentedChart(PureChart):
     bpm_segments: List[MeasureBPMPair] = Factory(list)
     stop_segments: List[MeasureMeasurePair] = Factory(list)
     offset: Time = 0
+    radar_values: Optional[Tuple[CheaperFraction, ...]] = None
+    diagnostics: List[Diagnostic] = Factory(list)
+    source_digest: Optional[bytes] = None
+
+    def apply_timing_edit(self, timing: TimingSegments, edit: TimingEdit):
+        """Bring the note field up to date with an edit made to `timing`, which has to share this chart's segments."""
+        self.offset = timing.offset
+        self.note_field.apply_timing_edit(timing, edit)
 
 
 @attrs(cmp=False, auto_attribs=True)
@@ -77,63 +122,29 @@ class Simfile(object):
     stop_segments: List[MeasureMeasurePair] = Factory(list)
     offset: Time = 0
     meta: Dict[str, str] = Factory(dict)
-    charts: List[AugmentedChart] = Factory(list)
+    # Charts are untimed `PureChart`s when the simfile isn't timeable
+    charts: List[PureChart] = Factory(list)
+    diagnostics: List[Diagnostic] = Factory(list)
 
     _file_context: str = None
+    _assets: Optional[AssetManager] = None
+    _timing: Optional[TimingSegments] = None
 
-    @property
-    def music_file(self):
-        return self.music_path and open(join(self._file_context, self.music_path), 'rb')
-
-    @property
-    def banner_file(self):
-        return self.banner_path and open(join(self._file_context, self.banner_path), 'rb')
-
-    @property
-    def bg_file(self):
-        return self.bg_path and open(join(self._file_context, self.bg_path), 'rb')
-
-    @property
-    def cdtitle_file(self):
-        return self.cdtitle_path and open(join(self._file_context, self.cdtitle_path), 'rb')
-
-
-class ChartTransformer(Transformer):
-    file_handles = set()
-
-    @staticmethod
-    def row(tokens) -> PureRow:
-        return PureRow.from_str_row(''.join(tokens))
-
-    @staticmethod
-    def measure(tokens: List[PureRow]) -> List[LocalRow]:
-        return [
-            token.evolve(LocalPosition(pos, len(tokens)))
-            for pos, token in enumerate(tokens)
-        ]
-
-    @staticmethod
-    def measures(tokens: List[List[LocalRow]]) -> List[GlobalRow]:
-        return [
-            local_row.evolve(Measure(global_pos))
-            for global_pos, measure in enumerate(tokens)
-            for local_row in measure
-        ]
+    @classmethod
+    def from_tokens(cls, tokens, strict: bool = False) -> 'Simfile':
+        """Assemble a simfile from parsed tags, charts are timed once every other tag has been seen.
 
-    @staticmethod
-    def notes(tokens: List[GlobalRow]) -> PureChart:
-        return PureChart.from_tokens(tokens)
+        Problems with the timing tags are kept in `diagnostics`, those of charts in their own `diagnostics`.
+        In `strict` mode, an `InvalidSimfileError` is raised for them before any chart is timed.
+        Otherwise, charts are left untimed as `PureChart`s if the timing tags can't time them, see `is_timeable`."""
+        result = cls()
+        charts = []
 
-    @staticmethod
-    def simfile(tokens) -> Simfile:
-        result = Simfile()
-
-        result._file_context = getcwd()
         for token in tokens:
             if not token:
                 continue
             elif isinstance(token, PureChart):
-                result.charts.append(token.evolve(result))
+                charts.append(token)
             elif isinstance(token, tuple):
                 result.meta[token[0]] = token[1]
             elif not token.children:
@@ -145,14 +156,149 @@ class ChartTransformer(Transformer):
             else:
                 setattr(result, token.data, token.children[0])
 
+        result.diagnostics = validate_bpm_segments(result.bpm_segments)
+        if strict:
+            result.check()
+            for chart in charts:
+                chart.check()
+
         if result.display_bpm is None:
             min_bpm = min(bpm_segment.bpm for bpm_segment in result.bpm_segments)
             max_bpm = max(bpm_segment.bpm for bpm_segment in result.bpm_segments)
 
             result.display_bpm = (min_bpm, max_bpm)
 
+        for chart in charts:
+            result.charts.append(chart.evolve(result) if result.is_timeable else chart)
+
         return result
 
+    @property
+    def is_timeable(self) -> bool:
+        """Whether charts can be timed by the timing tags, which isn't the case with a BPM of zero or less."""
+        return not any(diagnostic.kind in FATAL_TIMING_KINDS for diagnostic in self.diagnostics)
+
+    def check(self):
+        """Raise an `InvalidSimfileError` if any problem was found in the timing tags while parsing them."""
+        if self.diagnostics:
+            raise InvalidSimfileError(self.diagnostics, 'BPMS')
+
+    @property
+    def assets(self) -> AssetManager:
+        """The manager for the files this simfile refers to, created on first access.
+
+        Its buffers come from the process-wide pool of `assets.shared_pool`, assign an `AssetManager`
+        to `_assets` beforehand to use another pool."""
+        if self._assets is None:
+            self._assets = AssetManager(self._file_context)
+        return self._assets
+
+    @property
+    def music_file(self) -> Optional[AssetBuffer]:
+        return self.music_path and self.assets.buffer(self.music_path)
+
+    @property
+    def banner_file(self) -> Optional[AssetBuffer]:
+        return self.banner_path and self.assets.buffer(self.banner_path)
+
+    @property
+    def bg_file(self) -> Optional[AssetBuffer]:
+        return self.bg_path and self.assets.buffer(self.bg_path)
+
+    @property
+    def cdtitle_file(self) -> Optional[AssetBuffer]:
+        return self.cdtitle_path and self.assets.buffer(self.cdtitle_path)
+
+    @property
+    def timing(self) -> TimingSegments:
+        """The timing segments of this simfile, created on first access.
+
+        Edit timing through the simfile itself, so that its charts are kept in sync."""
+        if self._timing is None:
+            self._timing = TimingSegments(self.bpm_segments, self.stop_segments, self.offset)
+        return self._timing
+
+    @property
+    def preview_positions(self) -> Tuple[GlobalPosition, GlobalPosition]:
+        """Positions at which the preview window, `sample_start` lasting `sample_length`, starts and ends."""
+        return (self.timing.position_at(self.sample_start),
+                self.timing.position_at(CheaperFraction(self.sample_start) + self.sample_length))
+
+    def _apply_timing_edit(self, edit: TimingEdit) -> TimingEdit:
+        self.offset = self.timing.offset
+        for chart in self.charts:
+            if isinstance(chart, AugmentedChart):
+                chart.apply_timing_edit(self.timing, edit)
+        return edit
+
+    def set_bpm(self, measure: Measure, bpm: BPM) -> TimingEdit:
+        return self._apply_timing_edit(self.timing.set_bpm(measure, bpm))
+
+    def remove_bpm(self, measure: Measure) -> TimingEdit:
+        return self._apply_timing_edit(self.timing.remove_bpm(measure))
+
+    def set_stop(self, measure: Measure, length: Measure) -> TimingEdit:
+        return self._apply_timing_edit(self.timing.set_stop(measure, length))
+
+    def remove_stop(self, measure: Measure) -> TimingEdit:
+        return self._apply_timing_edit(self.timing.remove_stop(measure))
+
+    def set_offset(self, offset: Time) -> TimingEdit:
+        return self._apply_timing_edit(self.timing.set_offset(offset))
+
+    def close(self):
+        """Close the pooled buffers of this simfile's assets."""
+        if self._assets is not None:
+            self._assets.close()
+
+
+@lru_cache(4096)
+def _decode_measure(text: str) -> Tuple[Tuple[PureRow, int, int, Tuple[Tuple[int, NoteObject], ...]], ...]:
+    """Rows of a measure along with the numerator and denominator of their position within it
+    and their non-empty `(lane, object)` pairs, by its raw text.
+
+    Charts repeat measures a lot, so this skips building rows and positions for every repetition."""
+    rows = [PureRow.from_str_row(row) for row in text.split()]
+    positions = [LocalPosition(pos, len(rows)) for pos in range(len(rows))]
+    return tuple(
+        (row, position.numerator, position.denominator, tuple(
+            (lane, obj)
+            for lane, obj in enumerate(row)
+            if obj is not NoteObject.EMPTY_LANE
+        ))
+        for row, position in zip(rows, positions)
+    )
+
+
+class ChartTransformer(object):
+    """Callbacks for the rules of the SM grammar, embedded into the parser.
+
+    Lark only looks callbacks up by name, so this doesn't need to subclass `lark.Transformer`,
+    which keeps Lark from being imported until a parser is built."""
+
+    @staticmethod
+    def measures(tokens) -> Tuple[List[GlobalRow], List[Diagnostic]]:
+        """Rows of every measure, each decoded once per distinct text, only their measure being added.
+
+        Holds and rolls are checked as rows are made, which gives the diagnostics of the chart."""
+        rows = []
+        tracker = LongNoteTracker()
+        for global_pos, measure in enumerate(token for token in tokens if token is not None):
+            for row, numerator, denominator, objects in _decode_measure(str(measure)):
+                position = GlobalPosition(numerator + global_pos * denominator, denominator, _normalize=False)
+                rows.append(GlobalRow(row, position))
+                if objects:
+                    tracker.feed(position, objects)
+        return rows, tracker.finish()
+
+    @staticmethod
+    def notes(tokens: List[GlobalRow]) -> PureChart:
+        return PureChart.from_tokens(tokens)
+
+    @staticmethod
+    def simfile(tokens) -> Simfile:
+        return Simfile.from_tokens(tokens)
+
     def __getattribute__(self, item):
         if item.startswith('meta_'):
             def meta(tokens):
@@ -161,6 +307,10 @@ class ChartTransformer(Transformer):
             return meta
         return super().__getattribute__(item)
 
+    @staticmethod
+    def radar_values(tokens) -> Tuple[CheaperFraction, ...]:
+        return tuple(token for token in tokens if token is not None)
+
     @staticmethod
     def dontcare(__) -> None:
         return None
@@ -206,8 +356,6 @@ class ChartTransformer(Transformer):
     beat_beat_pair = staticmethod(MeasureMeasurePair.from_string_list)
     beat_bpm_pair = staticmethod(MeasureBPMPair.from_string_list)
 
-    row4 = row6 = row8 = row
-    measure4 = measure6 = measure8 = measure
     measures4 = measures6 = measures8 = measures
     no_comma_phrase = no_colon_phrase = phrase
 
@@ -215,17 +363,34 @@ class ChartTransformer(Transformer):
 _PACKAGE_DIR = path.split(__file__)[0]
 
 _SM_TRANSFORMER = ChartTransformer()
-_SM_PARSER = sm_parser = Lark.open(
-    path.join(_PACKAGE_DIR, 'sm_grammar.lark'),
-    parser='lalr',
-    transformer=_SM_TRANSFORMER,
-    start='simfile'
-)
 
 
-def parse(file: Union[str, TextIO]) -> Simfile:
-    this_dir = getcwd()
+@lru_cache(None)
+def get_parser():
+    """The SM parser, built on first use.
+
+    Lark caches the analysis of the grammar in the temporary directory,
+    so only the first process to build the parser pays for compiling its tables."""
+    from lark import Lark
+
+    return Lark.open(
+        path.join(_PACKAGE_DIR, 'sm_grammar.lark'),
+        parser='lalr',
+        transformer=_SM_TRANSFORMER,
+        start=['simfile', 'meta'],
+        cache=True
+    )
 
+
+def __getattr__(name):
+    # The parser used to be built on import under these names
+    if name in ('sm_parser', '_SM_PARSER'):
+        return get_parser()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def _read_simfile(file: Union[str, TextIO]) -> Tuple[str, str]:
+    """Read a simfile and strip it of comments, returning its text and its file name."""
     try:
         lines = file.readlines()
         file = file.name
@@ -240,12 +405,78 @@ def parse(file: Union[str, TextIO]) -> Simfile:
 
     simfile = ''.join(simfile)
     simfile = simfile.lstrip('\ufeff')
-    try:
-        chdir(path.dirname(file))
-        parsed_chart = _SM_PARSER.parse(simfile)
-    except Exception:
-        raise
-    finally:
-        chdir(this_dir)
+
+    return simfile, file
+
+
+def split_blocks(simfile: str) -> List[str]:
+    """Split the text of a simfile into its tags, such as `#TITLE:...` or `#NOTES:...`, without the semicolons."""
+    return [
+        block
+        for block in map(str.strip, simfile.split(';'))
+        if block
+    ]
+
+
+def block_tag(block: str) -> str:
+    """The name of the tag of a block, such as `#NOTES`."""
+    return block.split(':', 1)[0].strip().upper()
+
+
+def parse_block(block: str):
+    """Parse a single tag of a simfile, as split by `split_blocks`.
+
+    This gives the same token `Simfile.from_tokens` expects, `#NOTES` become untimed `PureChart`s."""
+    return get_parser().parse(block, start='meta')
+
+
+def _parse_chart(block: str, context: Simfile, strict: bool = False) -> PureChart:
+    """Parse and time a `#NOTES` block, in a worker, it's left untimed if `context` isn't timeable."""
+    chart = parse_block(block)
+    if strict:
+        chart.check()
+    return chart.evolve(context) if context.is_timeable else chart
+
+
+def parse(file: Union[str, TextIO], executor: Optional[Executor] = None, strict: bool = False) -> Simfile:
+    """Parse a simfile.
+
+    This doesn't touch process-wide state such as the working directory,
+    so it's safe to call from several threads at once.
+
+    With an `executor`, every other tag is parsed first, then `#NOTES` blocks are parsed and timed concurrently
+    in it and put back in their original order. Use a `ProcessPoolExecutor` for charts to be parsed in parallel.
+
+    Problems found while parsing are kept as diagnostics on the simfile and its charts,
+    in `strict` mode an `InvalidSimfileError` is raised for them instead, before any chart is timed."""
+    simfile, file = _read_simfile(file)
+
+    if executor is None and not strict:
+        parsed_chart = get_parser().parse(simfile, start='simfile')
+    elif executor is None:
+        parsed_chart = Simfile.from_tokens([parse_block(block) for block in split_blocks(simfile)], strict=True)
+    else:
+        header_tokens = []
+        chart_blocks = []
+        for block in split_blocks(simfile):
+            if block_tag(block) == '#NOTES':
+                chart_blocks.append(block)
+            else:
+                header_tokens.append(parse_block(block))
+
+        parsed_chart = Simfile.from_tokens(header_tokens, strict)
+        futures = [
+            executor.submit(_parse_chart, block, parsed_chart, strict)
+            for block in chart_blocks
+        ]
+        for future in futures:
+            chart = future.result()
+            if isinstance(chart, AugmentedChart):
+                # Charts share the segments of their simfile, which were copied to be sent to the worker
+                chart.bpm_segments = parsed_chart.bpm_segments
+                chart.stop_segments = parsed_chart.stop_segments
+            parsed_chart.charts.append(chart)
+
+    parsed_chart._file_context = path.dirname(path.abspath(file))
 
     return parsed_chart
@@ -0,0 +1,30 @@
+"""Small simfiles written out for tests."""
+from typing import Optional, Sequence
+
+CHART_MEASURES = (
+    ('1000', '0100', '0010', '0001'),
+    ('2000', '0000', '3000', '0000', '0110', '0000', '0000', '1001'),
+    ('1000', '0000', '0100', '0000', '0010', '0000', '0001', '0000', '1000', '0000', '0100', '0000'),
+    ('4000', '0000', '3000', '0000'),
+    ('1010', '0101', '1010', '0101', '1000', '0100', '0010', '0001',
+     '1000', '0100', '0010', '0001', '1000', '0100', '0010', '0001'),
+    ('0000', '0000', '0000', '0000'),
+    ('1000', '0000', '0000', '0100', '0000', '0000'),
+    ('1111', '0000', '0000', '0000'),
+)
+
+
+def notes_block(measures: Sequence[Sequence[str]] = CHART_MEASURES,
+                kind: str = 'dance-single',
+                difficulty: str = 'Hard',
+                meter: int = 9) -> str:
+    body = '\n,\n'.join('\n'.join(measure) for measure in measures)
+    return '#NOTES:\n     {}:\n     Tester:\n     {}:\n     {}:\n     0,0,0,0,0:\n{}\n;\n'.format(
+        kind, difficulty, meter, body)
+
+
+def simfile_text(*charts: str, bpms: str = '0=120,8=180', stops: Optional[str] = '12=0.5', offset: str = '0') -> str:
+    header = '#TITLE:Test;\n#OFFSET:{};\n#BPMS:{};\n'.format(offset, bpms)
+    if stops:
+        header += '#STOPS:{};\n'.format(stops)
+    return header + ''.join(charts or (notes_block(),))
@@ -0,0 +1,71 @@
+from ..incremental_parser import IncrementalParser
+from ..simfile_parser import parse
+from .simfiles import CHART_MEASURES, notes_block, simfile_text
+
+EDITED_MEASURES = (('0001', '0010', '0100', '1000'), *CHART_MEASURES[1:])
+
+
+def _times(simfile):
+    return [[(row.pos, row.time) for row in chart.note_field] for chart in simfile.charts]
+
+
+def _write(path, *charts, **tags):
+    path.write_text(simfile_text(*charts, **tags))
+    return str(path)
+
+
+def test_unchanged_file_reuses_everything(tmp_path):
+    file = _write(tmp_path / 'test.sm', notes_block(), notes_block(meter=10))
+    parser = IncrementalParser()
+    first = parser.parse(file)
+    parsed = parser.parsed_blocks
+
+    second = parser.parse(file)
+
+    assert parser.parsed_blocks == parsed
+    assert _times(second) == _times(first) == _times(parse(file))
+    for old, new in zip(first.charts, second.charts):
+        assert new is not old
+        assert new.note_field is not old.note_field
+        assert new.bpm_segments is second.bpm_segments
+
+
+def test_changed_notes_block_is_parsed_again(tmp_path):
+    path = tmp_path / 'test.sm'
+    parser = IncrementalParser()
+    parser.parse(_write(path, notes_block(), notes_block(meter=10)))
+    parsed = parser.parsed_blocks
+
+    result = parser.parse(_write(path, notes_block(EDITED_MEASURES), notes_block(meter=10)))
+
+    assert parser.parsed_blocks == parsed + 1
+    assert _times(result) == _times(parse(str(path)))
+    assert str(result.charts[0].note_field[0].row) == '0001'
+
+
+def test_changed_timing_times_charts_again_without_parsing_them(tmp_path):
+    path = tmp_path / 'test.sm'
+    parser = IncrementalParser()
+    first = parser.parse(_write(path, notes_block(), notes_block(meter=10)))
+    parsed = parser.parsed_blocks
+
+    result = parser.parse(_write(path, notes_block(), notes_block(meter=10), bpms='0=120,8=90'))
+
+    # Only the #BPMS block
+    assert parser.parsed_blocks == parsed + 1
+    assert _times(result) == _times(parse(str(path)))
+    assert _times(result) != _times(first)
+
+
+def test_timing_edits_stay_in_their_simfile(tmp_path):
+    file = _write(tmp_path / 'test.sm')
+    parser = IncrementalParser()
+    first = parser.parse(file)
+    expected = _times(first)
+
+    first.set_bpm(0, 100)
+    second = parser.parse(file)
+    assert _times(second) == expected
+
+    second.set_offset(1)
+    assert _times(parser.parse(file)) == expected
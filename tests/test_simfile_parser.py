@@ -0,0 +1,25 @@
+from ..simfile_parser import parse
+
+_HEADER = '#TITLE:Test;\n#OFFSET:0;\n#BPMS:0=120;\n'
+
+
+def _notes(kind: str, width: int) -> str:
+    measure = '\n'.join(('1' + '0' * (width - 1), '0' * width, '0' * (width - 1) + '1', '0' * width))
+    return '#NOTES:\n     {}:\n     Tester:\n     Hard:\n     9:\n     0,0,0,0,0:\n{}\n,\n{}\n;\n'.format(kind, measure, measure)
+
+
+def _parse(tmp_path, *charts):
+    path = tmp_path / 'test.sm'
+    path.write_text(_HEADER + ''.join(charts))
+    return parse(str(path))
+
+
+def test_chart_widths(tmp_path):
+    simfile = _parse(tmp_path, _notes('dance-single', 4), _notes('dance-solo', 6), _notes('dance-double', 8))
+    assert [len(chart.note_field[0].row) for chart in simfile.charts] == [4, 6, 8]
+    assert [len(chart.note_field) for chart in simfile.charts] == [8, 8, 8]
+
+
+def test_double_alone(tmp_path):
+    simfile = _parse(tmp_path, _notes('dance-double', 8))
+    assert len(simfile.charts[0].note_field[0].row) == 8
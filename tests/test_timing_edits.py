@@ -0,0 +1,63 @@
+from fractions import Fraction
+
+import pytest
+
+from ..chart_analysis import UntimedNotefield
+from ..rows import GlobalRow
+from ..simfile_parser import parse
+from .simfiles import notes_block, simfile_text
+
+EDITS = {
+    'set_bpm_new': lambda simfile: simfile.set_bpm(Fraction(5, 2), 150),
+    'set_bpm_first': lambda simfile: simfile.set_bpm(0, 90),
+    'set_bpm_existing': lambda simfile: simfile.set_bpm(2, 60),
+    'remove_bpm': lambda simfile: simfile.remove_bpm(2),
+    'set_stop_new': lambda simfile: simfile.set_stop(Fraction(9, 8), Fraction(1, 4)),
+    'set_stop_existing': lambda simfile: simfile.set_stop(3, Fraction(1, 2)),
+    'remove_stop': lambda simfile: simfile.remove_stop(3),
+    'set_offset': lambda simfile: simfile.set_offset(Fraction(-1, 10)),
+}
+
+
+def _parse(tmp_path):
+    path = tmp_path / 'test.sm'
+    path.write_text(simfile_text(notes_block(), notes_block(meter=10)))
+    return parse(str(path))
+
+
+def _timed_from_scratch(simfile, chart):
+    untimed = UntimedNotefield(GlobalRow(row.row, row.pos) for row in chart.note_field)
+    return untimed.calculate_timings(simfile.bpm_segments, simfile.stop_segments, simfile.offset)
+
+
+def _assert_matches_full_timing(simfile):
+    for chart in simfile.charts:
+        expected = _timed_from_scratch(simfile, chart)
+        assert [(row.pos, row.time) for row in chart.note_field] == [(row.pos, row.time) for row in expected]
+
+
+@pytest.mark.parametrize('edit', EDITS.values(), ids=list(EDITS))
+def test_edit_matches_full_timing(tmp_path, edit):
+    simfile = _parse(tmp_path)
+    before = [row.time for row in simfile.charts[0].note_field]
+
+    edit(simfile)
+
+    _assert_matches_full_timing(simfile)
+    assert [row.time for row in simfile.charts[0].note_field] != before
+
+
+def test_edits_in_sequence(tmp_path):
+    simfile = _parse(tmp_path)
+    for edit in EDITS.values():
+        edit(simfile)
+        _assert_matches_full_timing(simfile)
+
+
+def test_offset_shifts_every_row(tmp_path):
+    simfile = _parse(tmp_path)
+    before = [row.time for row in simfile.charts[0].note_field]
+
+    simfile.set_offset(simfile.offset - Fraction(1, 2))
+
+    assert [row.time - time for row, time in zip(simfile.charts[0].note_field, before)] == [Fraction(1, 2)] * len(before)
@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from ..basic_types import GlobalPosition, NoteObject
+from ..simfile_parser import AugmentedChart, parse
+from ..validation import DiagnosticKind, InvalidSimfileError, LongNoteTracker
+from .simfiles import CHART_MEASURES, notes_block, simfile_text
+
+UNMATCHED_MEASURES = (('2000', '0000', '0000', '0000'), ('0000', '0000', '0000', '0000'))
+
+
+def _kinds(diagnostics):
+    return [(diagnostic.kind, diagnostic.position, diagnostic.lane) for diagnostic in diagnostics]
+
+
+def _write(tmp_path, *charts, **tags):
+    path = tmp_path / 'test.sm'
+    path.write_text(simfile_text(*charts, **tags))
+    return str(path)
+
+
+def test_tracker():
+    tracker = LongNoteTracker()
+    tracker.feed(GlobalPosition(0), [(0, NoteObject.HOLD_START), (1, NoteObject.ROLL_START)])
+    tracker.feed(GlobalPosition(1, 4), [(0, NoteObject.TAP_OBJECT), (2, NoteObject.HOLD_ROLL_END)])
+    tracker.feed(GlobalPosition(1, 2), [(0, NoteObject.HOLD_ROLL_END)])
+
+    assert _kinds(tracker.finish()) == [
+        (DiagnosticKind.NOTE_IN_LONG_NOTE, GlobalPosition(1, 4), 0),
+        (DiagnosticKind.END_WITHOUT_START, GlobalPosition(1, 4), 2),
+        (DiagnosticKind.UNMATCHED_START, GlobalPosition(0), 1),
+    ]
+
+
+def test_valid_file_has_no_diagnostics(tmp_path):
+    simfile = parse(_write(tmp_path), strict=True)
+    assert not simfile.diagnostics
+    assert all(not chart.diagnostics for chart in simfile.charts)
+
+
+def test_chart_diagnostics(tmp_path):
+    file = _write(tmp_path, notes_block(), notes_block(UNMATCHED_MEASURES, meter=10))
+
+    simfile = parse(file)
+    assert not simfile.charts[0].diagnostics
+    assert _kinds(simfile.charts[1].diagnostics) == [(DiagnosticKind.UNMATCHED_START, GlobalPosition(0), 0)]
+
+    with pytest.raises(InvalidSimfileError) as error:
+        parse(file, strict=True)
+    assert error.value.diagnostics == simfile.charts[1].diagnostics
+
+
+def test_strict_in_worker_processes(tmp_path):
+    file = _write(tmp_path, notes_block(UNMATCHED_MEASURES))
+    with ProcessPoolExecutor(1) as executor, pytest.raises(InvalidSimfileError) as error:
+        parse(file, executor, strict=True)
+    assert _kinds(error.value.diagnostics) == [(DiagnosticKind.UNMATCHED_START, GlobalPosition(0), 0)]
+
+
+def test_bpm_diagnostics(tmp_path):
+    file = _write(tmp_path, bpms='0=120,8=0,4=150', stops=None)
+
+    simfile = parse(file)
+    assert {diagnostic.kind for diagnostic in simfile.diagnostics} == {
+        DiagnosticKind.NON_INCREASING_BPM_POSITIONS,
+        DiagnosticKind.NON_POSITIVE_BPM,
+    }
+    # A zero BPM leaves charts untimed instead of failing
+    assert not simfile.is_timeable
+    assert not any(isinstance(chart, AugmentedChart) for chart in simfile.charts)
+    assert len(simfile.charts[0].note_field) == sum(map(len, CHART_MEASURES))
+
+    with pytest.raises(InvalidSimfileError):
+        parse(file, strict=True)
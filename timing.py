@@ -0,0 +1,208 @@
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from attr import attrs
+
+from .basic_types import BPM, CheaperFraction, GlobalPosition, Measure, NullGlobalPosition, Time
+from .complex_types import MeasureBPMPair, MeasureMeasurePair
+
+
+@attrs(frozen=True, auto_attribs=True)
+class TimingEdit(object):
+    """Describes how an edit to timing segments changes the time of rows.
+
+    Rows at or before `since` keep their time, rows after `until` are shifted by `shift`
+    and rows in between have to be timed anew. `until` being None means every row after `since` is timed anew."""
+    since: GlobalPosition
+    until: Optional[GlobalPosition]
+    shift: CheaperFraction = CheaperFraction(0)
+
+
+@attrs(frozen=True, auto_attribs=True)
+class TimingKnots(object):
+    """A snapshot of the knots of `TimingSegments`, points where either the BPM changes or a stop happens.
+
+    Knot `i` is at `measures[i]`, reached `arrivals[i]` seconds after measure 0, stops for `stops[i]` seconds
+    and then moves at `seconds_per_measure[i]`. Times of rows are these minus `offset`."""
+    measures: Tuple[Measure, ...]
+    arrivals: Tuple[CheaperFraction, ...]
+    stops: Tuple[CheaperFraction, ...]
+    seconds_per_measure: Tuple[CheaperFraction, ...]
+    offset: Time
+
+
+class TimingSegments(object):
+    """An editable piecewise mapping of positions in a chart to time, defined by BPM and stop segments.
+
+    The segment lists are owned by this object, kept sorted and edited in place,
+    so lists shared with a Simfile and its charts stay in sync.
+
+    The first BPM segment applies from measure 0 onwards, a stop applies to rows strictly after it
+    and lasts as long as the BPM in effect at it dictates."""
+
+    def __init__(self,
+                 bpm_segments: List[MeasureBPMPair],
+                 stop_segments: List[MeasureMeasurePair],
+                 offset: Time = Time(0)):
+        self.bpm_segments = bpm_segments
+        self.stop_segments = stop_segments
+        self.offset = offset
+
+        self.bpm_segments.sort(key=attrgetter('measure'))
+        self.stop_segments.sort(key=attrgetter('measure'))
+        self._rebuild()
+
+    def _rebuild(self):
+        """Recompute the knots, points where either the BPM changes or a stop happens.
+
+        For each knot, the time of arrival, the length of the stop and the rate of time per measure after it are kept."""
+        bpm_segments = self.bpm_segments
+        stop_segments = self.stop_segments
+
+        knots = sorted({
+            Measure(0),
+            *(segment.measure for segment in bpm_segments if segment.measure > 0),
+            *(segment.measure for segment in stop_segments if segment.measure > 0)
+        })
+
+        measures, arrivals, stops, rates = [], [], [], []
+        bpm_index = 0
+        stop_index = 0
+        elapsed_time = CheaperFraction(0)
+        for knot in knots:
+            if measures:
+                elapsed_time += stops[-1] + rates[-1] * (knot - measures[-1])
+
+            while bpm_index + 1 < len(bpm_segments) and bpm_segments[bpm_index + 1].measure <= knot:
+                bpm_index += 1
+            rate = bpm_segments[bpm_index].bpm.measures_per_second
+
+            stop_time = CheaperFraction(0)
+            while stop_index < len(stop_segments) and stop_segments[stop_index].measure <= knot:
+                stop_time += CheaperFraction(stop_segments[stop_index].value, rate)
+                stop_index += 1
+
+            measures.append(knot)
+            arrivals.append(elapsed_time)
+            stops.append(stop_time)
+            rates.append(rate)
+
+        self._measures = measures
+        self._arrivals = arrivals
+        self._stops = stops
+        self._rates = rates
+
+    def knots(self) -> TimingKnots:
+        """The current knots, which aren't affected by later edits."""
+        return TimingKnots(tuple(self._measures), tuple(self._arrivals), tuple(self._stops), tuple(self._rates),
+                           self.offset)
+
+    def _elapsed_at(self, position: GlobalPosition, index: int) -> CheaperFraction:
+        """Time elapsed since measure 0 at `position`, where `index` is the last knot strictly before it."""
+        if index < 0:
+            return self._arrivals[0] + self._rates[0] * (position - self._measures[0])
+        return self._arrivals[index] + self._stops[index] + self._rates[index] * (position - self._measures[index])
+
+    def time_at(self, position: GlobalPosition) -> Time:
+        """Time of a row at `position`, before any stop at that position."""
+        index = bisect_left(self._measures, position) - 1
+        return Time(self._elapsed_at(position, index) - self.offset)
+
+    def times_at(self, positions: Iterable[GlobalPosition]) -> Iterator[Time]:
+        """Same as `time_at`, but for non-decreasing positions, which is faster than calling `time_at` for each."""
+        measures = self._measures
+        last_index = len(measures) - 1
+        index = -1
+        for position in positions:
+            while index < last_index and measures[index + 1] < position:
+                index += 1
+            yield Time(self._elapsed_at(position, index) - self.offset)
+
+    def position_at(self, time: Union[Time, float]) -> GlobalPosition:
+        """Position reached at `time`, the inverse of `time_at`.
+
+        During a stop the position stays at the stop, before measure 0 the first BPM is extrapolated."""
+        elapsed = CheaperFraction(time) + self.offset
+        index = bisect_right(self._arrivals, elapsed) - 1
+        if index < 0:
+            return GlobalPosition(self._measures[0] + (elapsed - self._arrivals[0]) / self._rates[0])
+
+        moving_since = self._arrivals[index] + self._stops[index]
+        if elapsed <= moving_since:
+            return GlobalPosition(self._measures[index])
+        return GlobalPosition(self._measures[index] + (elapsed - moving_since) / self._rates[index])
+
+    def _time_after(self, position: GlobalPosition) -> CheaperFraction:
+        """Time at `position` after any stop at that position."""
+        index = bisect_left(self._measures, position)
+        if index < len(self._measures) and self._measures[index] == position:
+            return self.time_at(position) + self._stops[index]
+        return self.time_at(position)
+
+    def _edit_bpm_segments(self, measure: Measure, edit) -> TimingEdit:
+        measures = [segment.measure for segment in self.bpm_segments]
+        since = Measure(0) if bisect_left(measures, measure) == 0 else measure
+        following = [segment_measure for segment_measure in measures if segment_measure > measure]
+        until = following[0] if following else None
+
+        old_time = until is not None and self._time_after(until)
+        edit()
+        self._rebuild()
+
+        if until is None:
+            return TimingEdit(since, None)
+        return TimingEdit(since, until, CheaperFraction(self._time_after(until) - old_time))
+
+    def _edit_stop_segments(self, measure: Measure, edit) -> TimingEdit:
+        old_time = self._time_after(measure)
+        edit()
+        self._rebuild()
+
+        return TimingEdit(measure, measure, CheaperFraction(self._time_after(measure) - old_time))
+
+    def set_bpm(self, measure: Measure, bpm: BPM) -> TimingEdit:
+        """Change the BPM of the segment at `measure`, inserting one if there's none."""
+
+        def edit():
+            for index, segment in enumerate(self.bpm_segments):
+                if segment.measure == measure:
+                    self.bpm_segments[index] = MeasureBPMPair(segment.measure, BPM(bpm))
+                    return
+            self.bpm_segments.append(MeasureBPMPair(Measure(measure), BPM(bpm)))
+            self.bpm_segments.sort(key=attrgetter('measure'))
+
+        return self._edit_bpm_segments(measure, edit)
+
+    def remove_bpm(self, measure: Measure) -> TimingEdit:
+        """Remove the BPM segment at `measure`, the previous segment takes its place."""
+        if len(self.bpm_segments) == 1:
+            raise ValueError('The only BPM segment can not be removed')
+
+        index = [segment.measure for segment in self.bpm_segments].index(measure)
+        return self._edit_bpm_segments(measure, lambda: self.bpm_segments.pop(index))
+
+    def set_stop(self, measure: Measure, length: Measure) -> TimingEdit:
+        """Change the length of the stop at `measure`, inserting one if there's none."""
+
+        def edit():
+            for index, segment in enumerate(self.stop_segments):
+                if segment.measure == measure:
+                    self.stop_segments[index] = MeasureMeasurePair(segment.measure, Measure(length))
+                    return
+            self.stop_segments.append(MeasureMeasurePair(Measure(measure), Measure(length)))
+            self.stop_segments.sort(key=attrgetter('measure'))
+
+        return self._edit_stop_segments(measure, edit)
+
+    def remove_stop(self, measure: Measure) -> TimingEdit:
+        """Remove the stop at `measure`."""
+        index = [segment.measure for segment in self.stop_segments].index(measure)
+        return self._edit_stop_segments(measure, lambda: self.stop_segments.pop(index))
+
+    def set_offset(self, offset: Time) -> TimingEdit:
+        """Change the offset, which shifts every row."""
+        shift = CheaperFraction(self.offset - offset)
+        self.offset = Time(offset)
+
+        return TimingEdit(NullGlobalPosition, NullGlobalPosition, shift)
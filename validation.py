@@ -0,0 +1,94 @@
+"""Structural checks of simfiles, run while they are parsed."""
+from enum import Enum, unique
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from attr import attrs
+
+from .basic_types import GlobalPosition, Measure, NoteObject
+from .complex_types import MeasureBPMPair
+
+
+@unique
+class DiagnosticKind(Enum):
+    UNMATCHED_START = 'hold or roll without an end'
+    END_WITHOUT_START = 'hold or roll end without a start'
+    NOTE_IN_LONG_NOTE = 'object inside a hold or roll'
+    NON_INCREASING_BPM_POSITIONS = 'BPM segment not after the previous one'
+    NON_POSITIVE_BPM = 'BPM that is zero or negative'
+
+
+# Diagnostics of timing tags that leave charts impossible to time
+FATAL_TIMING_KINDS = frozenset({DiagnosticKind.NON_POSITIVE_BPM})
+
+
+@attrs(frozen=True, auto_attribs=True)
+class Diagnostic(object):
+    """A problem found at `position`, in measures, on `lane` if it's about a single lane."""
+    kind: DiagnosticKind
+    position: Measure
+    lane: Optional[int] = None
+
+    def __str__(self):
+        if self.lane is None:
+            return '{} at measure {}'.format(self.kind.value, self.position)
+        return '{} at measure {}, lane {}'.format(self.kind.value, self.position, self.lane)
+
+
+class InvalidSimfileError(ValueError):
+    """Raised by strict parsing when a simfile has diagnostics, which are kept in `diagnostics`."""
+
+    def __init__(self, diagnostics: List[Diagnostic], context: str = ''):
+        self.diagnostics = diagnostics
+        self.context = context
+        shown = '; '.join(map(str, diagnostics[:5]))
+        more = ' and {} more'.format(len(diagnostics) - 5) if len(diagnostics) > 5 else ''
+        super().__init__('{}{}{}'.format(context and context + ': ', shown, more))
+
+    def __reduce__(self):
+        # Keeps the diagnostics when raised in a worker process
+        return type(self), (self.diagnostics, self.context)
+
+
+class LongNoteTracker(object):
+    """Follows which lanes are inside a hold or a roll as rows are fed in order of position."""
+
+    def __init__(self):
+        self.active: Dict[int, GlobalPosition] = {}
+        self.diagnostics: List[Diagnostic] = []
+
+    def feed(self, position: GlobalPosition, objects: Iterable[Tuple[int, NoteObject]]):
+        """Take in the non-empty `(lane, object)` pairs of the row at `position`."""
+        for lane, obj in objects:
+            if obj is NoteObject.HOLD_ROLL_END:
+                if self.active.pop(lane, None) is None:
+                    self.diagnostics.append(Diagnostic(DiagnosticKind.END_WITHOUT_START, position, lane))
+                continue
+
+            if lane in self.active:
+                self.diagnostics.append(Diagnostic(DiagnosticKind.NOTE_IN_LONG_NOTE, position, lane))
+            if obj is NoteObject.HOLD_START or obj is NoteObject.ROLL_START:
+                self.active[lane] = position
+
+    def finish(self) -> List[Diagnostic]:
+        """Diagnostics of every row fed, along with holds and rolls left without an end."""
+        self.diagnostics.extend(
+            Diagnostic(DiagnosticKind.UNMATCHED_START, position, lane)
+            for lane, position in sorted(self.active.items())
+        )
+        self.active.clear()
+        return self.diagnostics
+
+
+def validate_bpm_segments(bpm_segments: List[MeasureBPMPair]) -> List[Diagnostic]:
+    """Check that BPM segments are in order of position and have a positive BPM, before they're sorted."""
+    diagnostics = [
+        Diagnostic(DiagnosticKind.NON_INCREASING_BPM_POSITIONS, segment.measure)
+        for previous, segment in zip(bpm_segments, bpm_segments[1:])
+        if segment.measure <= previous.measure
+    ]
+    diagnostics.extend(
+        Diagnostic(DiagnosticKind.NON_POSITIVE_BPM, segment.measure)
+        for segment in bpm_segments
+        if segment.bpm <= 0
+    )
+    return diagnostics